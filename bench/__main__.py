@@ -0,0 +1,108 @@
+"""
+python -m bench --help
+
+Drives the app's real routes with a seeded synthetic workload and reports
+latency percentiles, throughput and queries per request for each action.
+See bench/README.md.
+"""
+
+import logging
+import sys
+
+import click
+
+from web import app, db
+from web.database import seed
+from . import database, report, runner, workload
+
+
+def quiet():
+    """
+    The app logs every statement and N+1 warnings outside of gunicorn,
+    which would be most of what gets measured.
+    """
+    logging.getLogger().setLevel(logging.ERROR)
+    app.logger.setLevel(logging.ERROR)
+    db.options['VERBOSE_SQL_EXECUTION']=False
+    app.config['WTF_CSRF_ENABLED']=False
+    # failed requests are counted as 500s rather than raised
+    app.config['PROPAGATE_EXCEPTIONS']=False
+
+
+@click.command()
+@click.option('--reset', is_flag=True, help='drop TS, recreate it from db/init.sql and the migrations, and seed it')
+@click.option('--users', default=2000, help='seeded users, also the users the workload logs in as')
+@click.option('--photos-per-user', default=10.0)
+@click.option('--follows-per-user', default=30.0)
+@click.option('--power', default=1.2, help='power law exponent of follows')
+@click.option('--groups-per-user', default=0.2)
+@click.option('--likes-per-photo', default=5.0)
+@click.option('--tags-per-photo', default=0.5)
+@click.option('--seed', 'seed_value', default=0, help='seeds both the data and the workload')
+@click.option('--concurrency', default=8, help='simulated users making requests at once')
+@click.option('--requests', default=2000, help='measured requests, in total')
+@click.option('--warmup', default=20, help='unmeasured requests per simulated user')
+@click.option('--mix', default='', help='action weights, ie feed=40,like=15 (default {})'.format(
+    ','.join('{}={}'.format(action, weight) for action, weight in workload.DEFAULT_MIX.items())
+))
+@click.option('--out', type=click.Path(dir_okay=False), help='save the results as json')
+@click.option('--baseline', type=click.Path(exists=True, dir_okay=False), help='results saved by an earlier --out')
+@click.option('--threshold', default=0.1, help='relative change that counts as a regression')
+def main(reset, users, photos_per_user, follows_per_user, power, groups_per_user,
+         likes_per_photo, tags_per_photo, seed_value, concurrency, requests, warmup,
+         mix, out, baseline, threshold):
+    quiet()
+    mix=workload.parse_mix(mix)
+    params=seed.Params(
+        users=users,
+        photos_per_user=photos_per_user,
+        follows_per_user=follows_per_user,
+        power=power,
+        groups_per_user=groups_per_user,
+        likes_per_photo=likes_per_photo,
+        tags_per_photo=tags_per_photo,
+        seed=seed_value,
+    )
+
+    if reset:
+        for table, rows in database.reset(params).items():
+            click.echo('seeded {} {}'.format(rows, table))
+
+    samples, seconds=runner.run(
+        app,
+        seed_value,
+        mix,
+        users,
+        database.photo_ids(),
+        concurrency,
+        requests,
+        warmup,
+    )
+    summary=report.summarize(samples, seconds)
+    click.echo(report.format_summary(summary))
+
+    run_params=dict(vars(params), concurrency=concurrency, requests=requests, warmup=warmup, mix=mix)
+    if out:
+        report.save(out, run_params, summary)
+
+    if baseline:
+        saved=report.load(baseline)
+        if saved['params'] != run_params:
+            click.echo('warning: baseline was run with different parameters', err=True)
+        changes=report.compare(saved, summary)
+        click.echo()
+        click.echo(report.format_comparison(changes))
+        regressions=[
+            (action, metric)
+            for action, metrics in changes.items()
+            for metric, (_, _, change) in metrics.items()
+            if change > threshold
+        ]
+        for action, metric in regressions:
+            click.echo('REGRESSION {} {}'.format(action, metric), err=True)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
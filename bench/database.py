@@ -0,0 +1,63 @@
+"""
+Building the benchmark database from scratch.
+
+The schema comes from db/init.sql plus db/migrations, exactly as a fresh
+deployment gets it, and the data from web/database/seed.py. init.sql
+creates and selects TS itself, so a reset only works against a database
+of that name, and it drops everything in it first.
+"""
+
+import os
+
+import pymysql
+
+from web import db
+from web.database import migrations, raw, seed
+
+INIT_SQL=os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    'db',
+    'init.sql'
+)
+
+DATABASE='TS'
+
+
+def reset(params):
+    """
+    Drops and recreates the database, then seeds it.
+
+    :param seed.Params params:
+    :return dict: rows written per table, from seed.seed
+    """
+    if raw.settings['db'] != DATABASE:
+        raise RuntimeError('init.sql only creates {}, not {}'.format(DATABASE, raw.settings['db']))
+
+    options=dict(raw.settings)
+    del options['db']
+    connection=pymysql.connect(charset='utf8mb4', autocommit=True, **options)
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute('DROP DATABASE IF EXISTS {}'.format(DATABASE))
+            for statement in migrations.read_statements(INIT_SQL):
+                cursor.execute(statement)
+    finally:
+        connection.close()
+
+    # anything pooled was connected to the database just dropped
+    raw.pool.reinit()
+    db.reinit()
+
+    migrations.migrate()
+    return seed.seed(params)
+
+
+def photo_ids(limit=1000):
+    """
+    Photos for the workload to like, the same ones on every run.
+    """
+    return [
+        row['photoID']
+        for row in raw.fetch_all('SELECT photoID FROM Photo ORDER BY photoID LIMIT %s', (limit,))
+    ]
+
@@ -0,0 +1,112 @@
+"""
+Summaries of a run and comparison against a saved baseline.
+"""
+
+import json
+
+PERCENTILES=(50, 95, 99)
+
+# per action numbers that are better when lower
+LOWER_IS_BETTER=('p50', 'p95', 'p99', 'queries', 'errors')
+
+
+def percentile(values, pct):
+    """
+    Nearest rank percentile of a sorted list.
+    """
+    if not values:
+        return 0.0
+    rank=max(0, min(len(values) - 1, int(round(pct / 100 * len(values) + 0.5)) - 1))
+    return values[rank]
+
+
+def summarize(samples, seconds):
+    """
+    :param samples: [ (action, latency seconds, queries or None, status) ]
+    :param float seconds: wall clock length of the measured part of the run
+    :return dict: { action: numbers, ..., 'all': numbers }
+    """
+    by_action={}
+    for sample in samples:
+        by_action.setdefault(sample[0], []).append(sample)
+        by_action.setdefault('all', []).append(sample)
+
+    summary={}
+    for action, rows in sorted(by_action.items()):
+        latencies=sorted(row[1] * 1000 for row in rows)
+        counted=[row[2] for row in rows if row[2] is not None]
+        numbers={
+            'requests'  : len(rows),
+            'throughput': len(rows) / seconds if seconds else 0.0,
+            'queries'   : sum(counted) / len(counted) if counted else None,
+            'errors'    : sum(1 for row in rows if row[3] >= 400),
+        }
+        for pct in PERCENTILES:
+            numbers['p{}'.format(pct)]=percentile(latencies, pct)
+        summary[action]=numbers
+    return summary
+
+
+def format_summary(summary):
+    lines=['{:<14}{:>9}{:>10}{:>10}{:>10}{:>10}{:>10}{:>8}'.format(
+        'action', 'requests', 'req/s', 'p50 ms', 'p95 ms', 'p99 ms', 'queries', 'errors'
+    )]
+    for action, numbers in summary.items():
+        lines.append('{:<14}{:>9}{:>10.1f}{:>10.1f}{:>10.1f}{:>10.1f}{:>10}{:>8}'.format(
+            action,
+            numbers['requests'],
+            numbers['throughput'],
+            numbers['p50'],
+            numbers['p95'],
+            numbers['p99'],
+            '-' if numbers['queries'] is None else '{:.1f}'.format(numbers['queries']),
+            numbers['errors'],
+        ))
+    return '\n'.join(lines)
+
+
+def save(path, params, summary):
+    with open(path, 'w') as f:
+        json.dump({'params': params, 'summary': summary}, f, indent=2, sort_keys=True)
+
+
+def load(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def compare(baseline, summary):
+    """
+    Relative change of every number against baseline, positive is worse.
+
+    :return: { action: { metric: (baseline, current, change) } }
+    """
+    changes={}
+    for action, numbers in summary.items():
+        before=baseline['summary'].get(action)
+        if before is None:
+            continue
+        for metric in LOWER_IS_BETTER + ('throughput',):
+            old, new=before.get(metric), numbers.get(metric)
+            if old is None or new is None:
+                continue
+            if old == 0:
+                change=0.0 if new == 0 else float('inf')
+            else:
+                change=(new - old) / old
+            if metric == 'throughput':
+                change=-change
+            changes.setdefault(action, {})[metric]=(old, new, change)
+    return changes
+
+
+def format_comparison(changes):
+    lines=['{:<14}{:<12}{:>12}{:>12}{:>10}'.format(
+        'action', 'metric', 'baseline', 'current', 'change'
+    )]
+    for action, metrics in changes.items():
+        for metric, (old, new, change) in metrics.items():
+            lines.append('{:<14}{:<12}{:>12.1f}{:>12.1f}{:>+9.1f}%'.format(
+                action, metric, old, new, change * 100
+            ))
+    return '\n'.join(lines)
@@ -0,0 +1,92 @@
+"""
+Runs the workload with a number of concurrent simulated users.
+
+Each worker is a thread with its own test client and random generator
+(seeded from the run seed and the worker's number). Workers log in, make
+their warmup requests, wait for each other, and only then start the
+measured requests, so connection pools, caches and the follow graph are
+warm before anything is timed.
+"""
+
+import logging
+import random
+import threading
+import time
+
+from . import workload
+
+
+class Worker(threading.Thread):
+    def __init__(self, app, number, seed, mix, users, photo_ids, warmup, requests, barrier):
+        super().__init__(name='bench-{}'.format(number), daemon=True)
+        self.rng=random.Random(seed * 1000003 + number)
+        self.user=workload.User(app, self.rng, users, photo_ids)
+        self.mix=mix
+        self.warmup=warmup
+        self.requests=requests
+        self.barrier=barrier
+        self.samples=[]
+        self.error=None
+
+    def request(self, action):
+        started=time.perf_counter()
+        try:
+            response=getattr(self.user, action)()
+            # streamed pages are only rendered as the body is read
+            response.get_data()
+            status=response.status_code
+            queries=workload.queries(response)
+        except Exception as e:
+            logging.getLogger(__name__).warning('{} failed: {!r}'.format(action, e))
+            status, queries=599, None
+        return action, time.perf_counter() - started, queries, status
+
+    def run(self):
+        try:
+            self.user.login()
+            for _ in range(self.warmup):
+                self.request(workload.pick(self.rng, self.mix))
+        except Exception as e:
+            self.error=e
+            self.barrier.abort()
+            raise
+        try:
+            self.barrier.wait()
+        except threading.BrokenBarrierError:
+            # another worker failed to start, run() reports it
+            return
+        for _ in range(self.requests):
+            self.samples.append(self.request(workload.pick(self.rng, self.mix)))
+
+
+def run(app, seed, mix, users, photo_ids, concurrency, requests, warmup):
+    """
+    :param int requests: measured requests in total, split over the workers
+    :param int warmup: unmeasured requests per worker
+    :return: (samples, seconds) for report.summarize
+    """
+    barrier=threading.Barrier(concurrency + 1)
+    workers=[
+        Worker(
+            app, number, seed, mix, users, photo_ids, warmup,
+            requests // concurrency + (number < requests % concurrency),
+            barrier
+        )
+        for number in range(concurrency)
+    ]
+    for worker in workers:
+        worker.start()
+    try:
+        barrier.wait()
+    except threading.BrokenBarrierError:
+        failed=next(worker for worker in workers if worker.error is not None)
+        raise RuntimeError('{} did not start: {}'.format(failed.name, failed.error))
+    started=time.perf_counter()
+    for worker in workers:
+        worker.join()
+    seconds=time.perf_counter() - started
+
+    samples=[]
+    for worker in workers:
+        samples.extend(worker.samples)
+    return samples, seconds
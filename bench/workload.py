@@ -0,0 +1,128 @@
+"""
+The scripted workload: what a simulated user does, and how often.
+
+Every action goes through the real routes with the Flask test client, so
+the whole request path (login session, notifications sidebar, templates)
+is measured, not just the queries. Each worker thread logs in as its own
+seeded user and then picks actions from the mix with its own seeded random
+generator, so a run with the same parameters issues the same requests.
+"""
+
+import base64
+import io
+import re
+
+from web.database import seed
+
+# smallest valid png, enough for ingest.sniff and imghdr
+PNG=base64.b64decode(
+    'iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mNkYPhfDwAChwGA60e6kgAAAABJRU5ErkJggg=='
+)
+
+SERVER_TIMING_QUERIES=re.compile(r'desc="(\d+) queries"')
+
+DEFAULT_MIX={
+    'feed'         : 40,
+    'profile'      : 15,
+    'notifications': 10,
+    'search'       : 10,
+    'like'         : 15,
+    'follow'       : 5,
+    'post'         : 5,
+}
+
+
+def parse_mix(text):
+    """
+    'feed=40,like=10' -> { 'feed': 40, 'like': 10 }
+    """
+    if not text:
+        return dict(DEFAULT_MIX)
+    mix={}
+    for part in text.split(','):
+        action, weight=part.split('=')
+        if action not in ACTIONS:
+            raise ValueError('unknown action {}'.format(action))
+        mix[action]=float(weight)
+    return mix
+
+
+def queries(response):
+    """
+    Statement count the app reported in its Server-Timing header.
+    """
+    for value in response.headers.getlist('Server-Timing'):
+        match=SERVER_TIMING_QUERIES.search(value)
+        if match is not None:
+            return int(match.group(1))
+    return None
+
+
+class User:
+    """
+    One simulated user, driving the app through its own test client.
+    """
+
+    def __init__(self, app, rng, users, photo_ids):
+        self.client=app.test_client()
+        self.rng=rng
+        self.users=users
+        self.photo_ids=photo_ids
+        self.username=seed.username(rng.randrange(users))
+
+    def login(self):
+        response=self.client.post('/auth/login', data={
+            'username': self.username,
+            'password': seed.PASSWORD,
+        })
+        if response.status_code != 302:
+            raise RuntimeError('unable to log in as {}'.format(self.username))
+
+    def other_user(self):
+        return seed.username(self.rng.randrange(self.users))
+
+    def feed(self):
+        return self.client.get('/')
+
+    def profile(self):
+        return self.client.get('/u/{}'.format(self.other_user()))
+
+    def notifications(self):
+        return self.client.get('/notifications/')
+
+    def search(self):
+        # a prefix of a seeded username, ie 'user0012'
+        term=self.other_user()[:self.rng.randrange(5, 10)]
+        return self.client.post('/u/', data={
+            'action' : 'search',
+            'content': term,
+        })
+
+    def like(self):
+        return self.client.post('/', data={
+            'action': 'like',
+            'id'    : self.rng.choice(self.photo_ids),
+        })
+
+    def follow(self):
+        return self.client.post('/u/', data={
+            'action': 'follow',
+            'id'    : self.other_user(),
+        })
+
+    def post(self):
+        return self.client.post('/', content_type='multipart/form-data', data={
+            'action' : 'post',
+            'image'  : (io.BytesIO(PNG), 'bench.png'),
+            'caption': 'bench @{}'.format(self.other_user()),
+            'public' : 'y',
+            'group'  : '',
+        })
+
+
+ACTIONS=tuple(DEFAULT_MIX)
+
+
+def pick(rng, mix):
+    actions=list(mix)
+    return rng.choices(actions, weights=[mix[action] for action in actions])[0]
@@ -0,0 +1,35 @@
+-- Covering indexes for the query shapes the app issues.
+-- The foreign keys in init.sql already give single column indexes on
+-- Photo(photoOwner), Follow(followeeUsername), Share(photoID), ... these
+-- extend them so the filters and sort columns are answered from the index.
+
+-- Photo.owned_by, users.view and the own photos branch of the feed,
+-- newest first
+CREATE INDEX PhotoOwnerTimestamp ON Photo (photoOwner, timestamp, allFollowers);
+
+-- feed ordering and keyset pagination
+CREATE INDEX PhotoTimestamp ON Photo (timestamp, photoID);
+
+-- ingest.storage.references counts rows sharing an upload
+CREATE INDEX PhotoFilePath ON Photo (filePath(191));
+
+-- accepted followees of a user, feed and group member choices
+CREATE INDEX FollowFollowerAccepted ON Follow (followerUsername, acceptedfollow, followeeUsername);
+
+-- pending follow requests for Person.notifications
+CREATE INDEX FollowFolloweeAccepted ON Follow (followeeUsername, acceptedfollow, followerUsername);
+
+-- pending tags for Person.notifications
+CREATE INDEX TagUsernameAccepted ON Tag (username, acceptedTag, photoID);
+
+-- tags of a page of photos, feed.hydrate
+CREATE INDEX TagPhoto ON Tag (photoID, username, acceptedTag);
+
+-- likes of a page of photos, feed.hydrate
+CREATE INDEX LikedPhoto ON Liked (photoID, username);
+
+-- groups a user belongs to, feed and Person.memberships
+CREATE INDEX BelongUsername ON Belong (username, groupName, groupOwner);
+
+-- photos shared into a group
+CREATE INDEX SharePhoto ON Share (photoID, groupName, groupOwner);
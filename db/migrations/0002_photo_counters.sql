@@ -0,0 +1,15 @@
+-- Like and comment counts kept on Photo, so drawing a tile does not need
+-- a COUNT(*). Maintained by home/counters.py in the same transaction as
+-- the Liked / Comment write, `flask reconcile-counters` repairs drift.
+
+-- timestamp is the first TIMESTAMP column on Photo, so MariaDB implicitly
+-- gave it ON UPDATE CURRENT_TIMESTAMP. Every counter bump would move the
+-- photo to the top of the feed, so keep only the insert default.
+ALTER TABLE Photo
+    MODIFY COLUMN timestamp Timestamp NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    ADD COLUMN likeCount    int NOT NULL DEFAULT 0,
+    ADD COLUMN commentCount int NOT NULL DEFAULT 0;
+
+UPDATE Photo
+SET likeCount    = (SELECT COUNT(*) FROM Liked WHERE Liked.photoID = Photo.photoID),
+    commentCount = (SELECT COUNT(*) FROM Comment WHERE Comment.photoID = Photo.photoID);
@@ -0,0 +1,15 @@
+-- Precomputed feeds. One row per (reader, photo) written when the photo is
+-- posted, see feed/timeline.py. timestamp is a copy of Photo.timestamp so
+-- a page is a single range scan of TimelineUsernameTimestamp.
+
+CREATE TABLE Timeline
+(
+    username  VARCHAR(20),
+    photoID   int,
+    timestamp Timestamp NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (username, photoID),
+    FOREIGN KEY (photoID) REFERENCES Photo (photoID) ON DELETE CASCADE,
+    FOREIGN KEY (username) REFERENCES Person (username) ON DELETE CASCADE
+);
+
+CREATE INDEX TimelineUsernameTimestamp ON Timeline (username, timestamp, photoID);
@@ -0,0 +1,10 @@
+-- Version counters for state every worker keeps in memory (the follow
+-- graph, the search index). A worker that changes one bumps its row and
+-- the others reload when they see it move, see database/stamps.py.
+
+CREATE TABLE Stamp
+(
+    name    VARCHAR(64),
+    version bigint NOT NULL DEFAULT 0,
+    PRIMARY KEY (name)
+);
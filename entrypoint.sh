@@ -1,5 +1,8 @@
 #!/bin/sh
 
+# never start gunicorn on a schema the migrations did not finish
+set -e
+
 echo "waiting for database"
 
 while ! mysqladmin ping -h "db" -P "3306" --silent; do
@@ -8,6 +11,11 @@ done
 
 sleep 3
 
+echo "applying migrations"
+
+# outside of gunicorn the config defaults to a local database
+MYSQL_DATABASE_HOST=db FLASK_APP=web flask migrate
+
 echo "starting gunicorn"
 
 gunicorn --config gunicorn_config.py web:app
@@ -5,8 +5,55 @@ makedirs('.data/log', exist_ok=True)
 PORT = environ.pop('PORT') if 'PORT' in environ else '80'
 WORKERS = environ.pop('WORKERS') if 'WORKERS' in environ else '2'
 SITENAME = environ.pop('SITENAME') if 'SITENAME' in environ else 'DEFAULT'
+THREADS = environ.pop('THREADS') if 'THREADS' in environ else '1'
+WORKER_CLASS = environ.pop('WORKER_CLASS') if 'WORKER_CLASS' in environ else 'sync'
 
 bind = '0.0.0.0:{}'.format(PORT)
 workers = int(WORKERS)
+threads = int(THREADS)
+worker_class = WORKER_CLASS
 errorlog = '.data/log/error.log'
 preload_app = True
+
+
+def when_ready(server):
+    # numbers left behind by workers of a previous run
+    from web import metrics
+    metrics.store.clear()
+
+
+def post_fork(server, worker):
+    # connections made in the master before the fork must not be shared
+    from web.app import db
+    from web.database import raw, routing
+    db.reinit()
+    raw.pool.reinit()
+    routing.reinit()
+
+    # open connections and load the follow graph and search
+    # index before the first request lands on this worker
+    from web.graph import graph
+    from web.search import index
+    try:
+        raw.pool.fill()
+        graph.load()
+        index.load()
+    except Exception as e:
+        server.log.warning('unable to warm up worker: {}'.format(e))
+
+
+def post_worker_init(worker):
+    # uploads left in the spool by a previous run, or by the worker this
+    # one replaces. Only ever in workers: finishing them starts the
+    # ingest and derivative pools and the metrics flusher, none of
+    # which may be running in the master when it forks.
+    from web import ingest
+    try:
+        ingest.recover()
+    except OSError as e:
+        worker.log.warning('unable to recover spooled uploads: {}'.format(e))
+
+    # kill -USR2 <worker pid> profiles every request on that worker for a
+    # while, see web/profiler. USR2 to the master is a binary upgrade.
+    from web import profiler
+    profiler.install_signal_handler()
@@ -0,0 +1,27 @@
+import pytest
+
+import web.database.stamps
+
+
+class Stamps:
+    """
+    Stands in for the Stamp table.
+    """
+
+    def __init__(self):
+        self.versions={}
+
+    def read(self, name):
+        return self.versions.get(name, 0)
+
+    def bump(self, name):
+        self.versions[name]=self.read(name) + 1
+        return self.versions[name]
+
+
+@pytest.fixture
+def stamps(monkeypatch):
+    stamps=Stamps()
+    monkeypatch.setattr(web.database.stamps, 'read', stamps.read)
+    monkeypatch.setattr(web.database.stamps, 'bump', stamps.bump)
+    return stamps
@@ -0,0 +1,94 @@
+import pytest
+
+from web.graph.graph import FollowGraph, STAMP, FOLLOWING, PENDING, NOT_FOLLOWING
+
+
+@pytest.fixture
+def rows():
+    return [
+        ('alice', 'bob', True),
+        ('alice', 'carol', False),
+        ('bob', 'alice', True),
+        ('carol', 'alice', True),
+    ]
+
+
+@pytest.fixture
+def graph(stamps, rows, monkeypatch):
+    graph=FollowGraph()
+    monkeypatch.setattr(graph, '_rows', lambda: iter(list(rows)))
+    return graph
+
+
+def test_state(graph):
+    assert graph.state('alice', 'bob') == FOLLOWING
+    assert graph.state('alice', 'carol') == PENDING
+    assert graph.state('bob', 'carol') == NOT_FOLLOWING
+    assert graph.state('alice', 'nobody') == NOT_FOLLOWING
+    assert graph.state('nobody', 'alice') == NOT_FOLLOWING
+
+
+def test_follows_many(graph):
+    assert graph.follows_many('alice', ['bob', 'carol', 'dave', 'alice']) == {
+        'bob'  : FOLLOWING,
+        'carol': PENDING,
+        'dave' : NOT_FOLLOWING,
+        'alice': NOT_FOLLOWING,
+    }
+    assert graph.follows_many('nobody', ['alice']) == {'alice': NOT_FOLLOWING}
+
+
+def test_followers(graph):
+    assert sorted(graph.followers_of('alice')) == ['bob', 'carol']
+    assert graph.follower_count('alice') == 2
+    # pending requests are not followers
+    assert graph.follower_count('carol') == 0
+
+
+def test_requested_then_accepted(graph):
+    graph.requested('dave', 'alice')
+    assert graph.state('dave', 'alice') == PENDING
+    assert graph.follower_count('alice') == 2
+
+    graph.accepted_follow('dave', 'alice')
+    assert graph.state('dave', 'alice') == FOLLOWING
+    assert sorted(graph.followers_of('alice')) == ['bob', 'carol', 'dave']
+
+
+def test_removed(graph):
+    graph.removed('alice', 'bob')
+    assert graph.state('alice', 'bob') == NOT_FOLLOWING
+    assert graph.followers_of('bob') == []
+
+    # rejecting a pending request
+    graph.removed('alice', 'carol')
+    assert graph.state('alice', 'carol') == NOT_FOLLOWING
+
+
+def test_write_moves_stamp(graph, stamps):
+    graph.ensure_fresh()
+    graph.requested('dave', 'alice')
+    assert stamps.read(STAMP) == graph.version == 1
+
+
+def test_reloads_when_another_worker_wrote(graph, stamps, rows):
+    graph.ensure_fresh()
+    # another worker commits a follow and bumps the stamp
+    rows.append(('dave', 'bob', True))
+    stamps.bump(STAMP)
+
+    assert graph.state('dave', 'bob') == FOLLOWING
+
+
+def test_write_after_another_worker_wrote_reloads(graph, stamps, rows):
+    graph.ensure_fresh()
+    rows.append(('dave', 'bob', True))
+    stamps.bump(STAMP)
+
+    # our own committed row is in Follow too by the time we are told
+    rows.append(('erin', 'bob', False))
+    graph.requested('erin', 'bob')
+
+    assert graph.state('dave', 'bob') == FOLLOWING
+    assert graph.state('erin', 'bob') == PENDING
+    assert graph.version == stamps.read(STAMP)
@@ -0,0 +1,37 @@
+from web.database.instrument import fingerprint
+
+
+def test_string_literals():
+    assert fingerprint("SELECT * FROM Person WHERE username = 'alice'") == \
+        'SELECT * FROM Person WHERE username = ?'
+    assert fingerprint('SELECT * FROM Person WHERE username = "it\\"s"') == \
+        'SELECT * FROM Person WHERE username = ?'
+
+
+def test_number_literals():
+    assert fingerprint('SELECT * FROM Photo WHERE photoID = 42 LIMIT 2.5') == \
+        'SELECT * FROM Photo WHERE photoID = ? LIMIT ?'
+    # digits inside names are not literals
+    assert fingerprint('SELECT * FROM t1 WHERE c2 = 3') == 'SELECT * FROM t1 WHERE c2 = ?'
+
+
+def test_placeholders_match_literals():
+    assert fingerprint('SELECT * FROM Liked WHERE photoID = %s AND username = %s') == \
+        fingerprint("SELECT * FROM Liked WHERE photoID = 7 AND username = 'bob'")
+
+
+def test_in_lists():
+    assert fingerprint('SELECT * FROM Tag WHERE photoID IN (%s, %s, %s)') == \
+        'SELECT * FROM Tag WHERE photoID IN (?+)'
+    assert fingerprint('SELECT * FROM Tag WHERE photoID IN (1,2)') == \
+        fingerprint('SELECT * FROM Tag WHERE photoID IN ( 3 , 4 , 5 , 6 )')
+    # a single value is left alone
+    assert fingerprint('SELECT * FROM Tag WHERE photoID IN (%s)') == \
+        'SELECT * FROM Tag WHERE photoID IN (?)'
+
+
+def test_whitespace():
+    assert fingerprint('''
+        SELECT *
+          FROM Photo\tWHERE  photoID = %s
+    ''') == 'SELECT * FROM Photo WHERE photoID = ?'
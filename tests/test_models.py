@@ -0,0 +1,44 @@
+import pytest
+
+import web.models as models_module
+from web.models import Person
+
+
+class PersonQuery:
+    """
+    Stands in for db.query('Person'), failing on anything that writes.
+    """
+
+    def __init__(self, rows):
+        self.rows=rows
+        self.filters={}
+
+    def find(self, **filters):
+        self.filters=filters
+        return self
+
+    def first(self):
+        return self.rows.get(self.filters['username'])
+
+    def new(self, **row):
+        raise AssertionError('inserted {}'.format(row))
+
+
+@pytest.fixture
+def people(monkeypatch):
+    people={'alice': object()}
+    monkeypatch.setattr(
+        models_module.db,
+        'query',
+        lambda table: PersonQuery(people)
+    )
+    return people
+
+
+def test_get_twice_does_not_insert(people):
+    assert Person.get('alice') is people['alice']
+    assert Person.get('alice') is people['alice']
+
+
+def test_get_missing(people):
+    assert Person.get('nobody') is None
@@ -0,0 +1,79 @@
+import pytest
+
+from web.search.index import SearchIndex, STAMP, trigrams
+
+
+@pytest.fixture
+def rows():
+    return [
+        {'username': 'ann', 'fname': 'Zed', 'lname': None},
+        {'username': 'annabel', 'fname': None, 'lname': None},
+        {'username': 'joanna', 'fname': None, 'lname': None},
+        {'username': 'bob', 'fname': 'Anne', 'lname': 'Smith'},
+        {'username': 'Hannah', 'fname': None, 'lname': None},
+        {'username': 'carol', 'fname': None, 'lname': 'Annandale'},
+    ]
+
+
+@pytest.fixture
+def index(stamps, rows, monkeypatch):
+    index=SearchIndex()
+    monkeypatch.setattr(index, '_rows', lambda: list(rows))
+    return index
+
+
+def test_trigrams():
+    assert trigrams('anna') == {'ann', 'nna'}
+    assert trigrams('an') == set()
+
+
+def test_ranking(index):
+    # exact, then username prefix, then name prefix, then substring,
+    # shorter usernames first within each group
+    assert index.search('ann', 10) == [
+        'ann',
+        'annabel',
+        'bob',
+        'carol',
+        'Hannah',
+        'joanna',
+    ]
+
+
+def test_case_insensitive(index):
+    assert index.search('HANN', 10) == ['Hannah']
+    assert index.search('  Ann  ', 1) == ['ann']
+
+
+def test_short_terms_only_match_prefixes(index):
+    # 'nn' is inside several usernames but shorter than a trigram
+    assert index.search('nn', 10) == []
+    assert index.search('jo', 10) == ['joanna']
+
+
+def test_substring_needs_every_trigram(index):
+    assert index.search('anna', 10) == ['annabel', 'carol', 'Hannah', 'joanna']
+    assert index.search('annx', 10) == []
+
+
+def test_limit(index):
+    assert index.search('ann', 2) == ['ann', 'annabel']
+
+
+def test_empty_term(index):
+    assert index.search('   ', 10) == []
+
+
+def test_added(index, stamps):
+    index.ensure_fresh()
+    index.added('annie')
+    assert index.search('anni', 10) == ['annie']
+    assert index.version == stamps.read(STAMP) == 1
+
+
+def test_reloads_when_another_worker_added(index, stamps, rows):
+    index.ensure_fresh()
+    rows.append({'username': 'annika', 'fname': None, 'lname': None})
+    stamps.bump(STAMP)
+
+    assert index.search('annik', 10) == ['annika']
@@ -8,6 +8,7 @@ from flask_wtf import CSRFProtect
 import bigsql
 
 from .config import Config
+from .database import Database, identity, instrument, raw, routing
 
 host = '0.0.0.0'
 port = 5000
@@ -18,14 +19,54 @@ app.config.from_object(Config())
 
 Bootstrap(app)
 CSRFProtect(app)
-db = bigsql.big_SQL(
+db = Database(
+    bigsql.big_SQL,
     user=app.config['MYSQL_DATABASE_USER'],
     pword=app.config['MYSQL_DATABASE_PASSWORD'],
     db=app.config['MYSQL_DATABASE_DB'],
     host=app.config['MYSQL_DATABASE_HOST'],
     VERBOSE_SQL_EXECUTION=app.config['VERBOSE_SQL_EXECUTION'],
     # DB_LOG_FILE=app.config['DB_LOG_FILE']
+    pool_options=dict(
+        max_size=app.config['DB_POOL_MAX_SIZE'],
+        max_lifetime=app.config['DB_POOL_MAX_LIFETIME'],
+        timeout=app.config['DB_POOL_TIMEOUT'],
+    ),
 )
+raw.configure(
+    host=app.config['MYSQL_DATABASE_HOST'],
+    user=app.config['MYSQL_DATABASE_USER'],
+    password=app.config['MYSQL_DATABASE_PASSWORD'],
+    db=app.config['MYSQL_DATABASE_DB'],
+    min_size=app.config['DB_POOL_MIN_SIZE'],
+    max_size=app.config['DB_POOL_MAX_SIZE'],
+    max_lifetime=app.config['DB_POOL_MAX_LIFETIME'],
+    ping_interval=app.config['DB_POOL_PING_INTERVAL'],
+    timeout=app.config['DB_POOL_TIMEOUT'],
+)
+routing.configure(
+    pin_seconds=app.config['REPLICA_PIN_SECONDS'],
+    max_lag=app.config['REPLICA_MAX_LAG'],
+    check_interval=app.config['REPLICA_CHECK_INTERVAL'],
+)
+for replica_host in app.config['MYSQL_REPLICA_HOSTS']:
+    routing.add_replica(
+        replica_host,
+        pool=raw.replica_pool(replica_host),
+        database=db.replica(replica_host),
+    )
+app.before_request(routing.choose)
+app.teardown_request(identity.log_stats)
+app.teardown_request(db.release)
+app.teardown_request(routing.release)
+
+instrument.configure(
+    enabled=app.config['SQL_INSTRUMENTATION'],
+    n_plus_one_threshold=app.config['SQL_N_PLUS_ONE_THRESHOLD'],
+    warn=app.config['DEBUG'] or app.config['TESTING'],
+)
+app.before_request(instrument.start)
+app.after_request(instrument.finish)
 
 if not app.config['DEBUG']:
     logging.basicConfig(filename=os.path.join(
@@ -38,12 +79,28 @@ else:
         level='DEBUG'
     )
 
+# cli commands
+from .database import migrations, plans
+
+# request metrics, registered before the blueprints import models
+from . import metrics
+app.before_request(metrics.request_started)
+app.after_request(metrics.request_finished)
+
+# sampling profiler, off unless configured or signalled
+from . import profiler
+app.before_request(profiler.request_started)
+app.teardown_request(profiler.request_finished)
+
 # register blueprints
 from .auth import auth
 from .users import users
 from .home import home
 from .groups import groups
 from .photos import photos
+from .notifications import pages as notification_pages
+from .events import pages as event_pages
+from .metrics import pages as metric_pages
 
 list(map(app.register_blueprint, (
     home,
@@ -51,6 +108,9 @@ list(map(app.register_blueprint, (
     users,
     groups,
     photos,
+    notification_pages,
+    event_pages,
+    metric_pages,
 )))
 
 if __name__ == '__main__':
@@ -0,0 +1,5 @@
+from .cache import memoize, backend, spans_workers, set_backend, Membership, \
+    memberships_key, unread_key, invalidate_memberships
+from .backends import LocalCache, RedisCache
+from .fragments import FragmentCache
+from . import fragments
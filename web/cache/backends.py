@@ -0,0 +1,155 @@
+"""
+Storage backends for the shared cache.
+
+LocalCache lives in the worker process. RedisCache is shared by every
+worker pointed at the same redis, values are pickled on the way in. Both
+expose the same get / set / delete interface, so tests can hand a LocalCache
+to cache.set_backend in place of redis.
+
+Counters are kept apart from pickled values (get_count / set_count / incr)
+so redis can adjust them atomically with INCRBY.
+"""
+
+import pickle
+import threading
+import time
+from collections import OrderedDict
+
+try:
+    import redis
+except ImportError:
+    redis=None
+
+MISSING=object()
+
+# INCRBY on a missing key would start it from 0, which is not the real
+# count, so only counters that are already cached are touched
+INCR_IF_EXISTS='''
+if redis.call('EXISTS', KEYS[1]) == 1 then
+    return redis.call('INCRBY', KEYS[1], ARGV[1])
+end
+return nil
+'''
+
+
+class LocalCache:
+    """
+    In process LRU with a per entry time to live.
+    """
+
+    def __init__(self, max_size=4096, ttl=60):
+        self.max_size=max_size
+        self.ttl=ttl
+        self._entries=OrderedDict()
+        self._lock=threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry=self._entries.get(key, MISSING)
+            if entry is MISSING:
+                return MISSING
+            expires, value=entry
+            if expires < time.monotonic():
+                del self._entries[key]
+                return MISSING
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        expires=time.monotonic() + (ttl or self.ttl)
+        with self._lock:
+            self._entries[key]=(expires, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def delete(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def get_count(self, key):
+        value=self.get(key)
+        return None if value is MISSING else value
+
+    def get_counts(self, keys):
+        return [self.get_count(key) for key in keys]
+
+    def set_count(self, key, value, ttl=None):
+        self.set(key, value, ttl)
+
+    def incr(self, key, delta=1):
+        """
+        Adjusts a counter that is already cached. A counter that is not
+        cached is left alone, the next get_count miss reloads it.
+
+        :return: new value, or None if key was not cached
+        """
+        with self._lock:
+            entry=self._entries.get(key, MISSING)
+            if entry is MISSING or entry[0] < time.monotonic():
+                return None
+            expires, value=entry
+            self._entries[key]=(expires, value + delta)
+            return value + delta
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class RedisCache:
+    """
+    Out of process cache shared by all workers. Needs the redis package.
+    """
+
+    def __init__(self, url, ttl=60, prefix='ts/'):
+        if redis is None:
+            raise RuntimeError('CACHE_BACKEND redis needs the redis package installed')
+        self.client=redis.Redis.from_url(url)
+        self.ttl=ttl
+        self.prefix=prefix
+
+    def get(self, key):
+        value=self.client.get(self.prefix + key)
+        if value is None:
+            return MISSING
+        return pickle.loads(value)
+
+    def set(self, key, value, ttl=None):
+        self.client.set(
+            self.prefix + key,
+            pickle.dumps(value),
+            ex=ttl or self.ttl
+        )
+
+    def delete(self, *keys):
+        if keys:
+            self.client.delete(*(self.prefix + key for key in keys))
+
+    def get_count(self, key):
+        value=self.client.get(self.prefix + key)
+        return None if value is None else int(value)
+
+    def get_counts(self, keys):
+        if not keys:
+            return []
+        return [
+            None if value is None else int(value)
+            for value in self.client.mget([self.prefix + key for key in keys])
+        ]
+
+    def set_count(self, key, value, ttl=None):
+        self.client.set(self.prefix + key, int(value), ex=ttl or self.ttl)
+
+    def incr(self, key, delta=1):
+        return self.client.eval(
+            INCR_IF_EXISTS,
+            1,
+            self.prefix + key,
+            delta
+        )
+
+    def clear(self):
+        for key in self.client.scan_iter(self.prefix + '*'):
+            self.client.delete(key)
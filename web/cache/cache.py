@@ -0,0 +1,86 @@
+"""
+Cache tier for hot reads that do not change often, such as group
+memberships. Follow edges live in web.graph, which uses the Stamp table to
+tell workers when to reload.
+
+`shared` is whatever CACHE_BACKEND names, a local in process LRU by default,
+or redis so plain values put there are seen by every gunicorn worker. Only
+plain, picklable values are cached, never bigsql models, which are mutable
+and belong to the request that loaded them. The handlers that change
+memberships call the invalidate_* hooks below.
+"""
+
+from collections import namedtuple
+
+from .backends import LocalCache, RedisCache, MISSING
+from .. import metrics
+from ..app import app
+
+Membership=namedtuple('Membership', ('groupName', 'groupOwner', 'username'))
+
+def _make_backend():
+    if app.config['CACHE_BACKEND'] == 'redis':
+        return RedisCache(
+            app.config['CACHE_URL'],
+            ttl=app.config['CACHE_TTL'],
+        )
+    return LocalCache(
+        max_size=app.config['CACHE_SIZE'],
+        ttl=app.config['CACHE_TTL'],
+    )
+
+
+shared=_make_backend()
+
+
+def backend():
+    """
+    The shared tier currently in use.
+    """
+    return shared
+
+
+def spans_workers():
+    """
+    Whether the shared tier is seen by every gunicorn worker. The
+    local backend is an LRU per process like any other.
+    """
+    return app.config['CACHE_BACKEND'] == 'redis'
+
+
+def set_backend(new_backend):
+    """
+    Swap out the shared tier, ie for a LocalCache in tests.
+    """
+    global shared
+    shared=new_backend
+
+
+def memoize(key, loader):
+    """
+    Gives back the cached value for key, calling loader and caching
+    what it gives back on a miss. None is never cached, so a row that
+    does not exist yet is not remembered as missing once it is created.
+
+    :param str key:
+    :param loader: callable producing the value
+    """
+    value=shared.get(key)
+    metrics.cache_lookup('shared', value is not MISSING)
+    if value is MISSING:
+        value=loader()
+        if value is not None:
+            shared.set(key, value)
+    return value
+
+
+def memberships_key(username):
+    return 'memberships/{}'.format(username)
+
+
+def unread_key(username):
+    return 'unread/{}'.format(username)
+
+
+def invalidate_memberships(*usernames):
+    shared.delete(*(memberships_key(username) for username in usernames))
@@ -0,0 +1,195 @@
+"""
+Rendered template fragments, ie feed tiles and user cards.
+
+A fragment is cached under (kind, id, version, variant):
+
+    - version is a counter per object kept in the shared tier, so bumping
+      it from any worker retires every cached copy. The handlers that
+      change what a tile shows (likes, comments, tags, deletes, ingest)
+      call bump().
+    - variant is whatever else the markup depends on for the viewer, ie
+      whether they own or liked the photo.
+
+A version that is not cached (never set, or expired after CACHE_TTL) is
+started from a fresh value rather than 0, so it can never match a copy
+rendered before. Copies rendered from rows read just before a concurrent
+bump can survive until the version expires, so CACHE_TTL bounds how stale
+a tile gets.
+
+A bump has to reach every worker, so versioned fragments are only cached
+when CACHE_BACKEND is redis. With the local backend they are rendered
+every time, and only fragments that are not versioned are cached.
+
+Rendered html is kept in a per worker LRU bounded by FRAGMENT_CACHE_BYTES.
+Templates use it through a call block:
+
+    {% call fragment('photo', photo.photoID, photo.tile_variant) %}
+      ...
+    {% endcall %}
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+from flask import g, has_request_context
+from markupsafe import Markup
+
+from . import cache
+from .. import metrics
+from ..app import app
+
+
+class FragmentCache:
+    """
+    LRU of rendered html, bounded by the total length of what it holds.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes=max_bytes
+        self.size=0
+        self.hits=0
+        self.misses=0
+        self._entries=OrderedDict()
+        self._lock=threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            html=self._entries.get(key)
+            if html is None:
+                self.misses+=1
+            else:
+                self.hits+=1
+                self._entries.move_to_end(key)
+        metrics.cache_lookup('fragment', html is not None)
+        return html
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._entries
+
+    def set(self, key, html):
+        if len(html) > self.max_bytes:
+            return
+        with self._lock:
+            old=self._entries.pop(key, None)
+            if old is not None:
+                self.size-=len(old)
+            self._entries[key]=html
+            self.size+=len(html)
+            while self.size > self.max_bytes:
+                _, evicted=self._entries.popitem(last=False)
+                self.size-=len(evicted)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size=0
+
+    def stats(self):
+        with self._lock:
+            lookups=self.hits + self.misses
+            return {
+                'entries' : len(self._entries),
+                'bytes'   : self.size,
+                'hits'    : self.hits,
+                'misses'  : self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+            }
+
+
+rendered=FragmentCache(app.config['FRAGMENT_CACHE_BYTES'])
+
+
+def enabled(versioned=True):
+    return not versioned or cache.spans_workers()
+
+
+def version_key(kind, id):
+    return 'fragment/{}/{}'.format(kind, id)
+
+
+def _known():
+    """
+    Versions already read during this request.
+    """
+    if not has_request_context():
+        return {}
+    if 'fragment_versions' not in g:
+        g.fragment_versions={}
+    return g.fragment_versions
+
+
+def versions(kind, ids):
+    """
+    Current versions of many objects, with one read of the shared tier.
+
+    :return dict: { id: version }, empty when versions are not kept
+    """
+    if not enabled():
+        return {}
+    known=_known()
+    missing=[version_key(kind, id) for id in ids if version_key(kind, id) not in known]
+    if missing:
+        shared=cache.backend()
+        for missing_key, value in zip(missing, shared.get_counts(missing)):
+            if value is None:
+                value=time.time_ns()
+                shared.set_count(missing_key, value)
+            known[missing_key]=value
+    return {id: known[version_key(kind, id)] for id in ids}
+
+
+def version(kind, id):
+    return versions(kind, (id,))[id]
+
+
+def bump(kind, *ids):
+    """
+    Retires the cached fragments of ids, in every worker.
+    """
+    if not enabled():
+        return
+    known=_known()
+    shared=cache.backend()
+    for id in ids:
+        # not cached means the next read starts a fresh version anyway
+        shared.incr(version_key(kind, id))
+        known.pop(version_key(kind, id), None)
+
+
+def key(kind, id, variant='', versioned=True):
+    return kind, id, version(kind, id) if versioned else None, variant
+
+
+def cached(kind, id, variant='', versioned=True):
+    """
+    Whether the fragment would be served from the cache, without
+    counting a lookup.
+    """
+    if not enabled(versioned):
+        return False
+    return key(kind, id, variant, versioned) in rendered
+
+
+def fragment(kind, id, variant='', versioned=True, caller=None):
+    """
+    The body of the call block, rendered once per key.
+
+    :param str kind: what is drawn, ie 'photo'
+    :param id: which one
+    :param str variant: anything else the markup depends on
+    :param bool versioned: False for fragments that only depend on
+        id and variant, which skips reading a version
+    """
+    if not enabled(versioned):
+        return Markup(caller())
+    fragment_key=key(kind, id, variant, versioned)
+    html=rendered.get(fragment_key)
+    if html is None:
+        html=str(caller())
+        rendered.set(fragment_key, html)
+    return Markup(html)
+
+
+app.add_template_global(fragment)
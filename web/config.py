@@ -11,23 +11,119 @@ class Config:
 
     MYSQL_DATABASE_USER = 'root'
     MYSQL_DATABASE_PASSWORD = 'password'
-    MYSQL_DATABASE_HOST = 'db'
+    # from the environment first, so commands run outside of
+    # gunicorn (flask migrate in entrypoint.sh) reach the same host
+    MYSQL_DATABASE_HOST = os.environ.get('MYSQL_DATABASE_HOST', 'db')
     MYSQL_DATABASE_DB = 'TS'
 
+    # hosts replicating from MYSQL_DATABASE_HOST, see database/routing.py
+    MYSQL_REPLICA_HOSTS = []
+    REPLICA_PIN_SECONDS = 5
+    REPLICA_MAX_LAG = 2
+    REPLICA_CHECK_INTERVAL = 5
+
     VERBOSE_SQL_GENERATION = False
-    VERBOSE_SQL_EXECUTION = True
+    # logs every statement, only turned on outside of gunicorn below.
+    # database/instrument.py covers production.
+    VERBOSE_SQL_EXECUTION = False
+
+    # per request query counts, Server-Timing and per endpoint histograms
+    SQL_INSTRUMENTATION = True
+    # same statement more often than this in one request is logged as a
+    # likely N+1, in debug and testing only
+    SQL_N_PLUS_ONE_THRESHOLD = 5
+
+    METRICS_FLUSH_SECONDS = 5
+    # /metrics wants an Authorization: Bearer <token> header, and
+    # refuses every scrape while no token is set
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+
+    # sampling profiler, see profiler/profiler.py. Requests to these
+    # endpoints, every PROFILE_EVERY-th request (0 for none) and every
+    # request for PROFILE_SIGNAL_SECONDS after a worker gets SIGUSR2
+    # are sampled every PROFILE_INTERVAL seconds
+    PROFILE_ENDPOINTS = ()
+    PROFILE_EVERY = 0
+    PROFILE_SIGNAL_SECONDS = 60
+    PROFILE_INTERVAL = 0.005
+
+    # per worker, for raw connections and for bigsql engines each
+    DB_POOL_MIN_SIZE = 1
+    DB_POOL_MAX_SIZE = 10
+    DB_POOL_MAX_LIFETIME = 3600
+    DB_POOL_PING_INTERVAL = 30
+    DB_POOL_TIMEOUT = 10
 
     UPLOAD_DIR = os.path.join(os.getcwd(), '.data/uploads')
+    SPOOL_DIR = os.path.join(os.getcwd(), '.data/spool')
+    # held while an upload is stored or released, see ingest/storage.py
+    STORAGE_LOCK = os.path.join(os.getcwd(), '.data/storage.lock')
     LOG_DIR = os.path.join(os.getcwd(), '.data/log')
+    # one file per worker process, see metrics/store.py
+    METRICS_DIR = os.path.join(os.getcwd(), '.data/metrics')
+    # collapsed stacks, one file per endpoint and worker
+    PROFILE_DIR = os.path.join(LOG_DIR, 'profiles')
 
     DB_LOG_FILE = os.path.join(LOG_DIR, 'db_log.log')
 
+    CACHE_BACKEND = 'local'
+    CACHE_URL = 'redis://redis:6379/0'
+    CACHE_TTL = 60
+    CACHE_SIZE = 4096
+    # rendered feed tiles and user cards per worker, see cache/fragments.py.
+    # Feed tiles are only cached with CACHE_BACKEND = 'redis'.
+    FRAGMENT_CACHE_BYTES = 16 * 1024 * 1024
+
+    MAX_CAPTION_MENTIONS = 20
+    INGEST_WORKERS = 2
+    DERIVATIVE_WORKERS = 2
+    DERIVATIVE_WIDTHS = (320, 640, 1280)
+    DERIVATIVE_FORMAT = 'webp'
+    DERIVATIVE_QUALITY = 80
+
+    # None, 'x-accel-redirect' or 'x-sendfile', see home/images.py
+    IMAGE_OFFLOAD = None
+    IMAGE_OFFLOAD_PREFIX = '/protected-uploads/'
+
+    # server sent events, see events/events.py. Each open page holds a
+    # worker thread, so only turn this on with WORKER_CLASS=gthread and
+    # plenty of THREADS, or gevent. 'local' only reaches streams held by
+    # the same worker, use 'redis' with more than one.
+    EVENTS_ENABLED = False
+    EVENTS_BROKER = 'local'
+    EVENTS_URL = 'redis://redis:6379/0'
+    # kept under gunicorn's default 30s timeout for sync workers
+    EVENTS_STREAM_SECONDS = 25
+    EVENTS_HEARTBEAT_SECONDS = 10
+    EVENTS_RETRY_MS = 3000
+
+    SEARCH_LIMIT = 20
+    USERS_PAGE_SIZE = 25
+
+    NOTIFICATION_SIDEBAR_SIZE = 5
+    NOTIFICATION_PAGE_SIZE = 25
+
+    FEED_PAGE_SIZE = 25
+    FEED_STREAMING = False
+
+    # read feeds from the precomputed Timeline table, see feed/timeline.py.
+    # Run `flask backfill-timeline` before turning this on.
+    FEED_TIMELINE = False
+    # posts by users with more accepted followers than this are not
+    # fanned out, their followers read them at request time instead
+    TIMELINE_FANOUT_LIMIT = 1000
+
     def __init__(self):
         os.makedirs(self.UPLOAD_DIR, exist_ok=True)
+        os.makedirs(self.SPOOL_DIR, exist_ok=True)
         os.makedirs(self.LOG_DIR, exist_ok=True)
+        os.makedirs(self.METRICS_DIR, exist_ok=True)
+        os.makedirs(self.PROFILE_DIR, exist_ok=True)
         if all('gunicorn' not in arg for arg in sys.argv):
             self.SECRET_KEY = 'DEBUG'
             self.DEBUG = True
-            self.MYSQL_DATABASE_HOST = '127.0.0.1'
+            if 'MYSQL_DATABASE_HOST' not in os.environ:
+                self.MYSQL_DATABASE_HOST = '127.0.0.1'
             self.DOMAIN = 'http://localhost:5000'
             self.VERBOSE_SQL_GENERATION = False
+            self.VERBOSE_SQL_EXECUTION = True
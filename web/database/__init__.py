@@ -0,0 +1,5 @@
+from .database import Database, Query, Session
+from . import identity
+from . import instrument
+from . import raw
+from . import routing
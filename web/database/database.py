@@ -0,0 +1,217 @@
+"""
+Thin wrappers around the bigsql engine so the app gets a look at
+queries and session writes before bigsql does.
+"""
+
+import threading
+
+import pymysql.err
+
+from . import identity
+from . import instrument
+from . import routing
+from .pool import ConnectionPool
+
+# a request failing with one of these leaves its engine's connection unusable
+CONNECTION_ERRORS=(pymysql.err.OperationalError, pymysql.err.InterfaceError)
+
+
+class Query:
+    """
+    Wraps a bigsql query for a single table. .find(...).first() is answered
+    from the request identity map when possible, .new and .delete mark the
+    table dirty. .first and .all are timed by instrument, under a
+    fingerprint built from the table, filter columns and raw clauses.
+    Everything else goes straight through to bigsql.
+    """
+
+    def __init__(self, query, table):
+        self._query=query
+        self._table=table
+        self._filters={}
+        self._cacheable=True
+        self._shape=[table]
+
+    def find(self, **kwargs):
+        if self._filters:
+            self._cacheable=False
+        self._filters=kwargs
+        self._shape.append('find({})'.format(', '.join(sorted(kwargs))))
+        self._query=self._query.find(**kwargs)
+        return self
+
+    def append_raw(self, *args, **kwargs):
+        self._cacheable=False
+        if args:
+            self._shape.append(instrument.fingerprint(args[0]))
+        self._query=self._query.append_raw(*args, **kwargs)
+        return self
+
+    def _timed(self, method):
+        with instrument.timed(' '.join(self._shape + [method])):
+            return getattr(self._query, method)()
+
+    def first(self):
+        if not self._cacheable or not self._filters:
+            return self._timed('first')
+        return identity.lookup(
+            self._table,
+            self._filters,
+            lambda: self._timed('first')
+        )
+
+    def all(self):
+        return self._timed('all')
+
+    def new(self, **kwargs):
+        identity.mark_dirty(self._table)
+        return self._query.new(**kwargs)
+
+    def delete(self, **kwargs):
+        identity.mark_dirty(self._table)
+        return self._query.delete(**kwargs)
+
+    def __getattr__(self, item):
+        return getattr(self._query, item)
+
+
+class Session:
+    """
+    Wraps the bigsql session so commits and rollbacks
+    invalidate the request identity map.
+    """
+
+    def __init__(self, session):
+        self._session=session
+
+    def add(self, obj):
+        identity.mark_dirty(type(obj).__name__)
+        return self._session.add(obj)
+
+    def delete(self, obj):
+        identity.mark_dirty(type(obj).__name__)
+        return self._session.delete(obj)
+
+    def commit(self):
+        with instrument.timed('session.commit'):
+            self._session.commit()
+        identity.committed()
+        routing.pin()
+
+    def rollback(self):
+        self._session.rollback()
+        identity.rolled_back()
+
+    def __getattr__(self, item):
+        return getattr(self._session, item)
+
+
+class PooledEngine:
+    """
+    A bigsql engine, and its session, as ConnectionPool sees a connection.
+
+    bigsql does not expose its socket, so there is nothing to ping. Engines
+    are replaced once they are older than the pool's max_lifetime instead,
+    and dropped when a request using one fails with a connection error.
+    """
+
+    def __init__(self, engine):
+        self.engine=engine
+        self.session=Session(engine.session)
+        self.open=True
+
+    def ping(self, reconnect=False):
+        pass
+
+    def close(self):
+        # bigsql has no close, the connection goes with the engine
+        self.open=False
+
+
+class Database:
+    """
+    Stands in for a bigsql.big_SQL engine. db.query and db.session are
+    wrapped, anything else (db.sql, ...) is the engine's own.
+
+    Engines come from a ConnectionPool, so a worker never holds more than
+    max_size of them. A thread (or greenlet, under gevent) checks one out
+    on first use and hands it back in release(), which runs when the
+    request is torn down. Outside of a request a thread keeps its engine
+    until it calls release() itself. reinit() drops them all after a fork
+    so workers never share the master's sockets.
+
+    While routing has picked a replica for the request, the replica's
+    engine is used instead.
+    """
+
+    def __init__(self, factory, pool_options=None, **options):
+        """
+        :param factory: makes a bigsql engine from options
+        :param dict pool_options: ConnectionPool arguments
+        """
+        self.factory=factory
+        self.options=options
+        self.pool_options=dict(pool_options or {})
+        self.pool=ConnectionPool(self._connect, **self.pool_options)
+        self.reinit()
+
+    def _connect(self):
+        return PooledEngine(self.factory(**self.options))
+
+    def reinit(self):
+        self.pool.reinit()
+        self._local=threading.local()
+
+    def replica(self, host):
+        """
+        A Database like this one, connected to host.
+        """
+        return Database(
+            self.factory,
+            pool_options=self.pool_options,
+            **dict(self.options, host=host)
+        )
+
+    def _pooled(self):
+        pooled=getattr(self._local, 'pooled', None)
+        if pooled is None:
+            pooled=self._local.pooled=self.pool.acquire()
+        return pooled
+
+    def release(self, exc=None):
+        """
+        Hands this thread's engine back to the pool. Registered as a
+        teardown_request hook. A failed request's session is rolled
+        back first, so nothing it left pending reaches the next one.
+        """
+        pooled=getattr(self._local, 'pooled', None)
+        if pooled is None:
+            return
+        self._local.pooled=None
+        broken=isinstance(exc, CONNECTION_ERRORS)
+        if exc is not None and not broken:
+            try:
+                pooled.engine.session.rollback()
+            except Exception:
+                broken=True
+        self.pool.release(pooled, broken=broken)
+
+    @property
+    def engine(self):
+        replica=routing.current()
+        if replica is not None:
+            return replica.database.engine
+        return self._pooled().engine
+
+    @property
+    def session(self):
+        replica=routing.current()
+        if replica is not None:
+            return replica.database.session
+        return self._pooled().session
+
+    def query(self, table):
+        return Query(self.engine.query(table), table)
+
+    def __getattr__(self, item):
+        return getattr(self.engine, item)
@@ -0,0 +1,214 @@
+"""
+Request scoped identity map and query cache.
+
+Within one request the same rows get selected over and over (the photo behind
+every Share and Tag, the Person behind every @mention, ...). Lookups made
+through db.query(...).find(...).first() are remembered on flask.g:
+
+    - lookups that pin down a primary key go in the identity map, keyed by
+      (table, primary key). Any later lookup covering that key is answered
+      from it, as long as the extra filters match the remembered object.
+    - every other lookup is remembered in the query cache, keyed by
+      (table, filters).
+
+Writes through the session drop whatever was remembered for the tables they
+touch. Outside of a request context nothing is remembered.
+"""
+
+import logging
+
+from flask import g, has_request_context
+
+logger=logging.getLogger(__name__)
+
+# mirrors the PRIMARY KEYs in db/init.sql
+PRIMARY_KEYS={
+    'Person'          : ('username',),
+    'Photo'           : ('photoID',),
+    'Follow'          : ('followerUsername', 'followeeUsername'),
+    'CloseFriendGroup': ('groupName', 'groupOwner'),
+    'Belong'          : ('groupName', 'groupOwner', 'username'),
+    'Share'           : ('groupName', 'groupOwner', 'photoID'),
+    'Liked'           : ('username', 'photoID'),
+    'Tag'             : ('username', 'photoID'),
+    'Comment'         : ('photoID', 'username'),
+    'Timeline'        : ('username', 'photoID'),
+}
+
+MISSING=object()
+
+
+class IdentityMap:
+    def __init__(self):
+        self.identities={}
+        self.queries={}
+        self.dirty=set()
+        self.hits=0
+        self.misses=0
+
+    def get(self, table, filters):
+        """
+        Gives back the remembered result for filters on table,
+        or MISSING if it has to be selected.
+        """
+        pk=_primary_key(table, filters)
+        if pk is not None and pk in self.identities:
+            obj=self.identities[pk]
+            if obj is None:
+                if len(filters) == len(PRIMARY_KEYS[table]):
+                    return None
+            elif all(
+                    _same(getattr(obj, column, MISSING), value)
+                    for column, value in filters.items()
+            ):
+                return obj
+        return self.queries.get(_query_key(table, filters), MISSING)
+
+    def put(self, table, filters, obj):
+        pk=_primary_key(table, filters)
+        exact=pk is not None and len(filters) == len(PRIMARY_KEYS[table])
+        if exact or (pk is not None and obj is not None):
+            self.identities[pk]=obj
+        else:
+            # a miss with extra filters says nothing about the key itself
+            self.queries[_query_key(table, filters)]=obj
+
+        if obj is not None and table in PRIMARY_KEYS:
+            self.identities[_primary_key(table, {
+                column: getattr(obj, column, None)
+                for column in PRIMARY_KEYS[table]
+            })]=obj
+
+    def invalidate(self, tables=None):
+        """
+        Forget everything remembered for tables. With no
+        tables given, forget everything.
+        """
+        if tables is None:
+            self.identities.clear()
+            self.queries.clear()
+            return
+        for cache in (self.identities, self.queries):
+            for key in [key for key in cache if key[0] in tables]:
+                del cache[key]
+
+
+def _primary_key(table, filters):
+    columns=PRIMARY_KEYS.get(table)
+    if columns is None or any(column not in filters for column in columns):
+        return None
+    return (table,) + tuple(str(filters[column]) for column in columns)
+
+
+def _query_key(table, filters):
+    return table, tuple(sorted(
+        (column, str(value))
+        for column, value in filters.items()
+    ))
+
+
+def _same(a, b):
+    return a == b or str(a) == str(b)
+
+
+def current():
+    """
+    The identity map for the current request, or None
+    when there is no request to scope it to.
+    """
+    if not has_request_context():
+        return None
+    if 'identity_map' not in g:
+        g.identity_map=IdentityMap()
+    return g.identity_map
+
+
+def lookup(table, filters, loader):
+    """
+    Answers a .find(**filters).first() on table from the identity map,
+    calling loader to select it when it has not been seen yet.
+    """
+    identity=current()
+    if identity is None:
+        return loader()
+
+    obj=identity.get(table, filters)
+    if obj is not MISSING:
+        identity.hits+=1
+        return obj
+
+    identity.misses+=1
+    obj=loader()
+    identity.put(table, filters, obj)
+    return obj
+
+
+def remember(table, key, loader):
+    """
+    Request scoped memo for values derived from table, such as
+    relationship lists. Dropped along with the rest of table on writes.
+    """
+    identity=current()
+    if identity is None:
+        return loader()
+
+    key=(table, key)
+    if key in identity.queries:
+        identity.hits+=1
+        return identity.queries[key]
+
+    identity.misses+=1
+    value=identity.queries[key]=loader()
+    return value
+
+
+def mark_dirty(table):
+    """
+    Records a pending write to table. It is forgotten right away,
+    and again once the write is committed.
+    """
+    identity=current()
+    if identity is not None:
+        identity.dirty.add(table)
+        identity.invalidate({table})
+
+
+def committed():
+    identity=current()
+    if identity is None:
+        return
+    # attribute writes on models are not seen here, so a commit
+    # we did not see any writes for could have touched anything
+    identity.invalidate(identity.dirty or None)
+    identity.dirty.clear()
+
+
+def committed_tables(tables):
+    """
+    Writes committed outside of the bigsql session.
+    """
+    identity=current()
+    if identity is not None:
+        identity.invalidate(set(tables))
+
+
+def rolled_back():
+    identity=current()
+    if identity is not None:
+        identity.invalidate()
+        identity.dirty.clear()
+
+
+def stats():
+    """
+    :return dict: identity map hits and misses for the current request
+    """
+    identity=current()
+    if identity is None:
+        return {'hits': 0, 'misses': 0}
+    return {'hits': identity.hits, 'misses': identity.misses}
+
+
+def log_stats(exc=None):
+    if has_request_context() and 'identity_map' in g:
+        logger.debug('identity map hits={hits} misses={misses}'.format(**stats()))
@@ -0,0 +1,172 @@
+"""
+Per request SQL accounting.
+
+Query.first / Query.all, session commits and every raw statement report how
+long they spent in the database. For each request this keeps:
+
+    - the number of statements and the total time spent on them
+    - a fingerprint of each statement (literals stripped) with its count,
+      time and the first line of app code that issued it
+
+When the request finishes the totals go out in a Server-Timing header, a
+fingerprint seen more than SQL_N_PLUS_ONE_THRESHOLD times is logged as a
+likely N+1 when running in debug or testing, and web.metrics adds the totals
+to its per route histograms.
+
+Statements run outside of a request, by the ingest pool for example, are
+not recorded.
+"""
+
+import logging
+import os
+import re
+import sys
+import time
+from contextlib import contextmanager
+
+from flask import g, has_request_context, request
+
+logger=logging.getLogger(__name__)
+
+LITERALS=re.compile(r"'(?:[^'\\]|\\.)*'|\"(?:[^\"\\]|\\.)*\"|\b\d+(?:\.\d+)?\b|%s")
+IN_LISTS=re.compile(r'\(\s*\?(?:\s*,\s*\?)+\s*\)')
+WHITESPACE=re.compile(r'\s+')
+
+WEB_ROOT=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATABASE_ROOT=os.path.dirname(os.path.abspath(__file__))
+
+settings={
+    'enabled'  : True,
+    'threshold': 5,
+    'warn'     : False,
+}
+
+
+def configure(enabled=True, n_plus_one_threshold=5, warn=False):
+    settings.update(
+        enabled=enabled,
+        threshold=n_plus_one_threshold,
+        warn=warn,
+    )
+
+
+def fingerprint(sql):
+    """
+    sql with literals and placeholders replaced by ?, IN lists
+    collapsed and whitespace squeezed, so the same statement with
+    different values gives the same fingerprint.
+    """
+    sql=LITERALS.sub('?', sql)
+    sql=IN_LISTS.sub('(?+)', sql)
+    return WHITESPACE.sub(' ', sql).strip()
+
+
+def call_site():
+    """
+    file:line of the innermost frame in app code outside web/database.
+    """
+    frame=sys._getframe(1)
+    while frame is not None:
+        filename=frame.f_code.co_filename
+        if filename.startswith(WEB_ROOT) and not filename.startswith(DATABASE_ROOT):
+            return '{}:{} {}'.format(
+                os.path.relpath(filename, os.path.dirname(WEB_ROOT)),
+                frame.f_lineno,
+                frame.f_code.co_name
+            )
+        frame=frame.f_back
+    return 'unknown'
+
+
+class Statement:
+    def __init__(self, site):
+        self.count=0
+        self.seconds=0.0
+        self.site=site
+
+
+class RequestStats:
+    def __init__(self):
+        self.count=0
+        self.seconds=0.0
+        self.statements={}
+        self.started=time.perf_counter()
+
+    def record(self, key, seconds):
+        statement=self.statements.get(key)
+        if statement is None:
+            statement=self.statements[key]=Statement(call_site())
+        statement.count+=1
+        statement.seconds+=seconds
+        self.count+=1
+        self.seconds+=seconds
+
+
+def current():
+    """
+    The current requests RequestStats, or None outside of a request.
+    """
+    if not settings['enabled'] or not has_request_context():
+        return None
+    if 'sql_stats' not in g:
+        g.sql_stats=RequestStats()
+    return g.sql_stats
+
+
+@contextmanager
+def timed(key):
+    """
+    Times the block as one statement with fingerprint key.
+    """
+    stats=current()
+    if stats is None:
+        yield
+        return
+    started=time.perf_counter()
+    try:
+        yield
+    finally:
+        stats.record(key, time.perf_counter() - started)
+
+
+def timed_sql(sql):
+    return timed(fingerprint(sql))
+
+
+def start():
+    """
+    before_request hook.
+    """
+    current()
+
+
+def finish(response):
+    """
+    after_request hook. Streamed responses are only accounted up to
+    the point the view returned.
+    """
+    stats=g.get('sql_stats', None)
+    if stats is None:
+        return response
+
+    response.headers.add(
+        'Server-Timing',
+        'db;dur={:.1f};desc="{} queries"'.format(stats.seconds * 1000, stats.count)
+    )
+    response.headers.add(
+        'Server-Timing',
+        'app;dur={:.1f}'.format((time.perf_counter() - stats.started) * 1000)
+    )
+
+    if settings['warn']:
+        for key, statement in stats.statements.items():
+            if statement.count > settings['threshold']:
+                logger.warning('possible N+1 on {}: {} x {} from {}'.format(
+                    request.endpoint,
+                    statement.count,
+                    key,
+                    statement.site
+                ))
+
+    return response
+
@@ -0,0 +1,112 @@
+"""
+Versioned schema migrations.
+
+db/init.sql is the baseline schema. Changes on top of it live in
+db/migrations as NNNN_description.sql and are applied in order by
+`flask migrate`, which records each applied version in SchemaVersion so
+it is only ever run once. Statements in a migration are separated by ;
+at the end of a line.
+"""
+
+import os
+import re
+
+import click
+
+from . import raw
+from ..app import app
+
+MIGRATION_DIR=os.path.join(
+    os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))),
+    'db',
+    'migrations'
+)
+
+MIGRATION_NAME=re.compile(r'^(\d+)_[\w-]+\.sql$')
+
+VERSION_TABLE='''
+CREATE TABLE IF NOT EXISTS SchemaVersion
+(
+    version   int,
+    name      VARCHAR(256),
+    appliedAt Timestamp DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (version)
+)
+'''
+
+
+def available():
+    """
+    :return: [ (version, file name) ] in order
+    """
+    migrations=[]
+    for name in os.listdir(MIGRATION_DIR):
+        match=MIGRATION_NAME.match(name)
+        if match is not None:
+            migrations.append((int(match.group(1)), name))
+    return sorted(migrations)
+
+
+def statements(name):
+    return read_statements(os.path.join(MIGRATION_DIR, name))
+
+
+def read_statements(path):
+    """
+    The ; separated statements in the sql file at path, comments dropped.
+    """
+    with open(path) as f:
+        sql='\n'.join(
+            line for line in f.read().splitlines()
+            if not line.strip().startswith('--')
+        )
+    return [
+        statement.strip()
+        for statement in re.split(r';\s*$', sql, flags=re.MULTILINE)
+        if statement.strip()
+    ]
+
+
+def applied():
+    with raw.transaction() as tx:
+        tx.execute(VERSION_TABLE)
+        return {
+            row['version']
+            for row in tx.fetch_all('SELECT version FROM SchemaVersion')
+        }
+
+
+def migrate():
+    """
+    Applies every migration that has not been yet.
+
+    :return: [ file name of each migration applied ]
+    """
+    done=applied()
+    ran=[]
+    for version, name in available():
+        if version in done:
+            continue
+        # DDL commits implicitly in MariaDB, so a migration that fails
+        # part way needs fixing by hand before it is rerun
+        with raw.transaction() as tx:
+            for statement in statements(name):
+                tx.execute(statement)
+            tx.execute(
+                'INSERT INTO SchemaVersion (version, name) VALUES (%s, %s)',
+                (version, name)
+            )
+        ran.append(name)
+    return ran
+
+
+@app.cli.command('migrate')
+def migrate_command():
+    """
+    Applies pending migrations from db/migrations.
+    """
+    ran=migrate()
+    for name in ran:
+        click.echo('applied {}'.format(name))
+    if not ran:
+        click.echo('schema is up to date')
@@ -0,0 +1,230 @@
+"""
+Query plan regression checks.
+
+Every query shape the app issues is listed in SHAPES. `flask
+check-query-plans` runs EXPLAIN on each of them against the configured
+database and fails if any of them reads a table with a full scan (type
+ALL). Derived and union temporary tables are not counted, scanning those
+is how they are read.
+
+Plans on near empty tables mean nothing, so the check is meant to be run
+against a seeded scratch database (--seed fills it first, see seed.py).
+"""
+
+import click
+
+from . import raw, seed as seeding
+from ..app import app
+
+
+class Shape:
+    def __init__(self, name, sql, args, full_scan_ok=False):
+        """
+        :param str name: what issues it
+        :param str sql: the statement, as the app issues it
+        :param args: callable taking a Samples, giving the args for sql
+        :param bool full_scan_ok: reading the whole table is intended
+        """
+        self.name=name
+        self.sql=sql
+        self.args=args
+        self.full_scan_ok=full_scan_ok
+
+
+class Samples:
+    """
+    Real values from the database to EXPLAIN the shapes with.
+    """
+
+    def __init__(self):
+        self.user=raw.fetch_all(
+            'SELECT followerUsername AS username FROM Follow '
+            'GROUP BY followerUsername ORDER BY COUNT(*) DESC LIMIT 1'
+        )[0]['username']
+        photos=raw.fetch_all('SELECT photoID, timestamp, filePath FROM Photo ORDER BY photoID LIMIT 25')
+        self.photo_ids=tuple(photo['photoID'] for photo in photos)
+        self.timestamp=photos[-1]['timestamp']
+        self.file_path=photos[0]['filePath'] or ''
+        group=raw.fetch_all('SELECT groupName, groupOwner FROM Share LIMIT 1')
+        self.group=(group[0]['groupName'], group[0]['groupOwner']) if group else ('', '')
+
+
+def _photo_ids(samples):
+    return samples.photo_ids
+
+
+def _in(n=25):
+    return '({})'.format(raw.placeholders(range(n)))
+
+
+def shapes():
+    from ..feed import feed, timeline
+    from ..notifications import inbox
+
+    return [
+        Shape(
+            'feed.visible_photos',
+            'SELECT Photo.* FROM Photo' + feed.VISIBLE_CLAUSE + feed.ORDER_CLAUSE + 'LIMIT %s',
+            lambda s: (s.user,) * 3 + (26,)
+        ),
+        Shape(
+            'feed.visible_photos with cursor',
+            'SELECT Photo.* FROM Photo' + feed.VISIBLE_CLAUSE + feed.BEFORE_CLAUSE + feed.ORDER_CLAUSE + 'LIMIT %s',
+            lambda s: (s.user,) * 3 + (s.timestamp, s.timestamp, s.photo_ids[-1], 26)
+        ),
+        Shape(
+            'feed.timeline_photos with cursor',
+            'SELECT Photo.* FROM Photo JOIN ('
+            '(SELECT Timeline.photoID FROM Timeline WHERE Timeline.username = %s '
+            + timeline._keyset('Timeline') +
+            'ORDER BY Timeline.timestamp DESC, Timeline.photoID DESC LIMIT %s)'
+            ') AS Visible ON Visible.photoID = Photo.photoID' + feed.ORDER_CLAUSE + 'LIMIT %s',
+            lambda s: (s.user, s.timestamp, s.timestamp, s.photo_ids[-1], 26, 26)
+        ),
+        Shape(
+            'Photo.owned_by',
+            'SELECT * FROM Photo WHERE photoOwner = %s',
+            lambda s: (s.user,)
+        ),
+        Shape(
+            'users.view',
+            'SELECT * FROM Photo WHERE photoOwner = %s AND allFollowers = TRUE',
+            lambda s: (s.user,)
+        ),
+        Shape(
+            'notifications.inbox.fetch',
+            inbox.PENDING + inbox.ORDER_CLAUSE,
+            lambda s: (s.user, s.user, 26)
+        ),
+        Shape(
+            'notifications.inbox.unread_count',
+            inbox.COUNT,
+            lambda s: (s.user, s.user)
+        ),
+        Shape(
+            'groups.view member choices',
+            'SELECT * FROM Follow WHERE followerUsername = %s',
+            lambda s: (s.user,)
+        ),
+        Shape(
+            'feed.hydrate likes',
+            'SELECT * FROM Liked WHERE Liked.photoID IN ' + _in() + ' AND Liked.username = %s',
+            lambda s: tuple(_photo_ids(s)) + (s.user,)
+        ),
+        Shape(
+            'feed.hydrate comments',
+            'SELECT * FROM Comment WHERE Comment.photoID IN ' + _in() + ' ORDER BY Comment.timestamp',
+            _photo_ids
+        ),
+        Shape(
+            'feed.hydrate tags',
+            'SELECT * FROM Tag WHERE Tag.photoID IN ' + _in(),
+            _photo_ids
+        ),
+        Shape(
+            'Person.get',
+            'SELECT * FROM Person WHERE username = %s',
+            lambda s: (s.user,)
+        ),
+        Shape(
+            'Person.memberships',
+            'SELECT * FROM Belong WHERE username = %s',
+            lambda s: (s.user,)
+        ),
+        Shape(
+            'Photo.create membership',
+            'SELECT * FROM Belong WHERE groupName = %s AND groupOwner = %s AND username = %s',
+            lambda s: s.group + (s.user,)
+        ),
+        Shape(
+            'CloseFriendGroup.photos',
+            'SELECT * FROM Share WHERE groupName = %s AND groupOwner = %s',
+            lambda s: s.group
+        ),
+        Shape(
+            'photos.view shares',
+            'SELECT * FROM Share WHERE photoID = %s',
+            lambda s: s.photo_ids[:1]
+        ),
+        Shape(
+            'groups.manage',
+            'SELECT * FROM CloseFriendGroup WHERE groupOwner = %s',
+            lambda s: (s.user,)
+        ),
+        Shape(
+            'Photo.parse_caption',
+            'SELECT username FROM Person WHERE username IN (%s, %s)',
+            lambda s: (s.user, s.user)
+        ),
+        Shape(
+            'ingest.storage.references',
+            'SELECT COUNT(*) AS refs FROM Photo WHERE filePath = %s',
+            lambda s: (s.file_path,)
+        ),
+        Shape(
+            'graph.load',
+            'SELECT followerUsername, followeeUsername, acceptedfollow FROM Follow',
+            lambda s: (),
+            full_scan_ok=True
+        ),
+        Shape(
+            'stamps.read',
+            'SELECT version FROM Stamp WHERE name = %s',
+            lambda s: ('follow-graph',)
+        ),
+        Shape(
+            'search.index.load',
+            'SELECT username, fname, lname FROM Person ORDER BY username',
+            lambda s: (),
+            full_scan_ok=True
+        ),
+        Shape(
+            'users.browse_users',
+            'SELECT * FROM Person WHERE Person.username > %s ORDER BY Person.username LIMIT %s',
+            lambda s: (s.user, 26)
+        ),
+    ]
+
+
+def full_scans(shape, samples):
+    """
+    :return: [ table read with a full scan by shape ]
+    """
+    rows=raw.fetch_all('EXPLAIN ' + shape.sql, shape.args(samples))
+    return [
+        row['table']
+        for row in rows
+        if row['type'] == 'ALL' and not (row['table'] or '').startswith('<')
+    ]
+
+
+def check():
+    """
+    :return: [ (shape, [ table ]) ] for every shape that regressed
+    """
+    samples=Samples()
+    failures=[]
+    for shape in shapes():
+        scanned=full_scans(shape, samples)
+        if scanned and not shape.full_scan_ok:
+            failures.append((shape, scanned))
+    return failures
+
+
+@app.cli.command('check-query-plans')
+@click.option('--seed', is_flag=True, help='fill the (scratch) database with synthetic data first')
+@click.option('--users', default=2000, help='users to seed')
+def check_command(seed, users):
+    """
+    Fails if any query shape the app issues does a full table scan.
+    """
+    if seed:
+        for table, rows in seeding.seed(seeding.Params(users=users)).items():
+            click.echo('seeded {} {}'.format(rows, table))
+
+    failures=check()
+    for shape, tables in failures:
+        click.echo('FULL SCAN {}: {}'.format(shape.name, ', '.join(tables)), err=True)
+    if failures:
+        raise SystemExit(1)
+    click.echo('{} query shapes use indexes'.format(len(shapes())))
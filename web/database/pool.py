@@ -0,0 +1,155 @@
+"""
+A small thread safe connection pool.
+
+Connections are handed out by connection() and returned when the block
+exits. Idle connections that have not been used for ping_interval seconds
+are pinged before being handed out again, and connections older than
+max_lifetime are closed rather than reused, so stale or half closed
+sockets are not handed to requests.
+
+A pool is only valid in the process that made its connections. After a
+fork, reinit() forgets them without closing them (closing would send a
+QUIT down the socket the parent is still using). The pool also notices
+a changed pid on its own and does the same.
+"""
+
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class ConnectionPool:
+    def __init__(self, connect, min_size=1, max_size=10, max_lifetime=3600,
+                 ping_interval=30, timeout=10):
+        """
+        :param connect: callable making a new connection
+        :param int min_size: connections kept open even when idle
+        :param int max_size: connections open at once, idle or not
+        :param max_lifetime: seconds before a connection is replaced
+        :param ping_interval: seconds idle before a connection is pinged
+        :param timeout: seconds to wait for a free connection
+        """
+        self.connect=connect
+        self.min_size=min_size
+        self.max_size=max_size
+        self.max_lifetime=max_lifetime
+        self.ping_interval=ping_interval
+        self.timeout=timeout
+        self.reinit()
+
+    def reinit(self):
+        """
+        Forgets every connection, for use in a freshly forked process.
+        """
+        self.pid=os.getpid()
+        self.lock=threading.Condition()
+        self.idle=deque()
+        self.born={}
+        self.size=0
+
+    def _open(self):
+        connection=self.connect()
+        self.born[id(connection)]=time.monotonic()
+        return connection
+
+    def _discard(self, connection):
+        self.born.pop(id(connection), None)
+        self._close(connection)
+
+    @staticmethod
+    def _close(connection):
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+    def _healthy(self, connection, last_used):
+        now=time.monotonic()
+        if now - self.born.get(id(connection), now) > self.max_lifetime:
+            return False
+        if now - last_used > self.ping_interval:
+            try:
+                connection.ping(reconnect=False)
+            except Exception:
+                return False
+        return True
+
+    def acquire(self):
+        if self.pid != os.getpid():
+            self.reinit()
+
+        deadline=time.monotonic() + self.timeout
+        while True:
+            with self.lock:
+                while True:
+                    if self.idle:
+                        connection, last_used=self.idle.pop()
+                        break
+                    if self.size < self.max_size:
+                        self.size+=1
+                        connection=None
+                        break
+                    remaining=deadline - time.monotonic()
+                    if remaining <= 0 or not self.lock.wait(remaining):
+                        raise PoolTimeout('no free connection after {}s'.format(self.timeout))
+            if connection is None:
+                break
+
+            # outside the lock, a slow ping must not hold up other checkouts
+            if self._healthy(connection, last_used):
+                return connection
+            with self.lock:
+                self.born.pop(id(connection), None)
+                self.size-=1
+                self.lock.notify()
+            self._close(connection)
+
+        try:
+            return self._open()
+        except Exception:
+            with self.lock:
+                self.size-=1
+                self.lock.notify()
+            raise
+
+    def release(self, connection, broken=False):
+        if self.pid != os.getpid():
+            return
+        with self.lock:
+            if broken or time.monotonic() - self.born.get(id(connection), 0) > self.max_lifetime:
+                self._discard(connection)
+                self.size-=1
+            else:
+                self.idle.append((connection, time.monotonic()))
+            self.lock.notify()
+
+    @contextmanager
+    def connection(self):
+        connection=self.acquire()
+        try:
+            yield connection
+        except Exception:
+            self.release(connection, broken=not connection.open)
+            raise
+        self.release(connection)
+
+    def fill(self):
+        """
+        Opens connections up to min_size.
+        """
+        connections=[self.acquire() for _ in range(max(self.min_size - len(self.idle), 0))]
+        for connection in connections:
+            self.release(connection)
+
+    def stats(self):
+        return {
+            'size': self.size,
+            'idle': len(self.idle),
+            'in_use': self.size - len(self.idle),
+        }
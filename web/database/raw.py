@@ -0,0 +1,262 @@
+"""
+Plain pymysql access for the statements bigsql can not express, such as
+multi row INSERTs. Connections come out of a ConnectionPool and each
+transaction() holds its own for its duration, so this is safe to use from
+worker threads as well as requests.
+
+Tables written through a transaction are dropped from the request identity
+map once it commits. Writes can be buffered on the Transaction and are
+sent as grouped statements when it flushes, see Transaction.
+"""
+
+import logging
+import re
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import pymysql
+import pymysql.cursors
+
+from . import identity
+from . import instrument
+from . import routing
+from .pool import ConnectionPool
+
+logger=logging.getLogger(__name__)
+
+WRITE_STATEMENT=re.compile(
+    r'^\s*(?:INSERT\s+(?:IGNORE\s+)?INTO|REPLACE\s+INTO|UPDATE|DELETE\s+FROM)\s+`?(\w+)',
+    re.IGNORECASE
+)
+
+settings={}
+
+
+def configure(host, user, password, db, **pool_options):
+    settings.update(
+        host=host,
+        user=user,
+        password=password,
+        db=db,
+    )
+    for option, value in pool_options.items():
+        setattr(pool, option, value)
+
+
+def connect(host=None):
+    options=dict(settings)
+    if host is not None:
+        options['host']=host
+    return pymysql.connect(
+        charset='utf8mb4',
+        cursorclass=pymysql.cursors.DictCursor,
+        autocommit=True,
+        **options
+    )
+
+
+pool=ConnectionPool(connect)
+
+
+def replica_pool(host):
+    """
+    A pool like the primary one, connected to host.
+    """
+    return ConnectionPool(
+        lambda: connect(host=host),
+        min_size=pool.min_size,
+        max_size=pool.max_size,
+        max_lifetime=pool.max_lifetime,
+        ping_interval=pool.ping_interval,
+        timeout=pool.timeout,
+    )
+
+
+def placeholders(values):
+    """
+    '%s, %s, ...' with one %s per value, for IN (...) clauses.
+    """
+    return ', '.join(['%s'] * len(values))
+
+
+INSERT, DELETE='insert', 'delete'
+
+# rows per statement when a buffered group is flushed
+MAX_BATCH=1000
+
+
+def _chunks(rows):
+    for start in range(0, len(rows), MAX_BATCH):
+        yield rows[start:start + MAX_BATCH]
+
+
+def _key_clause(columns, keys):
+    """
+    'col IN (%s, ...)' or '(a, b) IN ((%s, %s), ...)' matching keys.
+    """
+    if len(columns) == 1:
+        return '{} IN ({})'.format(columns[0], placeholders(keys))
+    row='({})'.format(placeholders(columns))
+    return '({}) IN ({})'.format(
+        ', '.join(columns),
+        ', '.join([row] * len(keys))
+    )
+
+
+class Transaction:
+    """
+    Writes made with add and delete are buffered rather than sent one
+    at a time. At flush they go out grouped: one multi row INSERT per
+    table and column set, one DELETE ... WHERE key IN (...) per table.
+    Groups are flushed in the order each was first used, and anything
+    buffered is flushed before any other statement runs, so reads
+    inside the transaction see its own writes.
+    """
+
+    def __init__(self, connection):
+        self.connection=connection
+        self.cursor=connection.cursor()
+        self.tables=set()
+        self.pending=OrderedDict()
+        self.statements=0
+
+    def _execute(self, sql, args=None):
+        match=WRITE_STATEMENT.match(sql)
+        if match is not None:
+            self.tables.add(match.group(1))
+        with instrument.timed_sql(sql):
+            self.cursor.execute(sql, args)
+        self.statements+=1
+        return self.cursor
+
+    def execute(self, sql, args=None):
+        self.flush()
+        return self._execute(sql, args)
+
+    def add(self, table, ignore=False, **row):
+        """
+        Buffers an INSERT of row into table.
+
+        :param bool ignore: INSERT IGNORE, skipping rows that collide
+        """
+        columns=tuple(sorted(row))
+        self.pending.setdefault((INSERT, table, columns, ignore), []).append(
+            tuple(row[column] for column in columns)
+        )
+
+    def delete(self, table, **key):
+        """
+        Buffers deleting the row of table matching key.
+        """
+        if not key:
+            raise ValueError('delete needs a key')
+        columns=tuple(sorted(key))
+        self.pending.setdefault((DELETE, table, columns), []).append(
+            tuple(key[column] for column in columns)
+        )
+
+    def flush(self):
+        """
+        Sends everything buffered so far.
+        """
+        pending, self.pending=self.pending, OrderedDict()
+        for group, rows in pending.items():
+            kind, table, columns=group[:3]
+            if kind == INSERT:
+                self._insert_rows(table, columns, rows, ignore=group[3])
+                continue
+
+            keys=list(OrderedDict.fromkeys(rows))
+            for chunk in _chunks(keys):
+                self._execute(
+                    'DELETE FROM {} WHERE {}'.format(
+                        table,
+                        _key_clause(columns, chunk)
+                    ),
+                    tuple(value for key in chunk for value in key)
+                )
+
+    def _insert_rows(self, table, columns, rows, ignore=False):
+        inserted=0
+        row='({})'.format(placeholders(columns))
+        for chunk in _chunks(rows):
+            self._execute(
+                'INSERT {}INTO {} ({}) VALUES {}'.format(
+                    'IGNORE ' if ignore else '',
+                    table,
+                    ', '.join(columns),
+                    ', '.join([row] * len(chunk))
+                ),
+                tuple(value for r in chunk for value in r)
+            )
+            inserted+=self.cursor.rowcount
+        return inserted
+
+    def insert_many(self, table, columns, rows, ignore=False):
+        """
+        Inserts all of rows now, with multi row INSERTs of up to
+        MAX_BATCH rows each.
+
+        :param str table:
+        :param columns: column names, in the order values appear in each row
+        :param rows: [ (value, ...), ... ]
+        :param bool ignore: INSERT IGNORE, skipping rows that collide
+        :return int: number of rows inserted
+        """
+        self.flush()
+        return self._insert_rows(table, columns, list(rows), ignore)
+
+    def fetch_all(self, sql, args=None):
+        return self.execute(sql, args).fetchall()
+
+    @property
+    def lastrowid(self):
+        return self.cursor.lastrowid
+
+    @property
+    def rowcount(self):
+        return self.cursor.rowcount
+
+
+# called with the number of statements of every committed
+# transaction, see metrics.transaction_committed
+commit_listeners=[]
+
+
+@contextmanager
+def transaction():
+    """
+    Yields a Transaction that is committed when the block exits
+    cleanly and rolled back if it raises.
+    """
+    with pool.connection() as connection:
+        connection.begin()
+        tx=Transaction(connection)
+        try:
+            yield tx
+            tx.flush()
+            with instrument.timed('COMMIT'):
+                connection.commit()
+        except Exception:
+            connection.rollback()
+            raise
+        finally:
+            tx.cursor.close()
+    for listener in commit_listeners:
+        listener(tx.statements)
+    logger.debug('committed {} statements'.format(tx.statements))
+    if tx.tables:
+        identity.committed_tables(tx.tables)
+        routing.pin()
+
+
+def fetch_all(sql, args=None, primary=False):
+    """
+    Runs a single read and gives back its rows as dicts. Served by
+    the requests replica when routing has picked one, unless primary.
+    """
+    replica=None if primary else routing.current()
+    with (pool if replica is None else replica.pool).connection() as connection:
+        with connection.cursor() as cursor, instrument.timed_sql(sql):
+            cursor.execute(sql, args)
+            return cursor.fetchall()
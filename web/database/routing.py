@@ -0,0 +1,133 @@
+"""
+Read replica routing.
+
+GET and HEAD requests never write in this app, so their reads can go to a
+replica. Before each request one is chosen, and for the rest of the request
+db.query / db.session and raw.fetch_all are served by it. Everything else,
+and every transaction, stays on the primary.
+
+A replica is skipped while it is more than REPLICA_MAX_LAG seconds behind
+(or not replicating at all); if none are usable the primary is used. After
+a commit the users session is pinned to the primary for
+REPLICA_PIN_SECONDS, so whoever just posted or liked something reads their
+own write on the next page.
+"""
+
+import logging
+import random
+import time
+
+from flask import g, has_request_context, request, session
+
+logger=logging.getLogger(__name__)
+
+PIN_KEY='_primary_until'
+
+settings={
+    'pin_seconds'   : 5,
+    'max_lag'       : 2,
+    'check_interval': 5,
+}
+
+
+class Replica:
+    def __init__(self, host, pool, database):
+        """
+        :param str host:
+        :param pool: raw ConnectionPool for host
+        :param database: Database for host
+        """
+        self.host=host
+        self.pool=pool
+        self.database=database
+        self.lag=None
+        self.checked_at=0
+
+    def current_lag(self):
+        """
+        Seconds behind the primary, or None if it is not replicating or
+        can not be reached. Only asked every check_interval seconds.
+        """
+        now=time.monotonic()
+        if now - self.checked_at < settings['check_interval']:
+            return self.lag
+        self.checked_at=now
+        try:
+            with self.pool.connection() as connection:
+                with connection.cursor() as cursor:
+                    cursor.execute('SHOW SLAVE STATUS')
+                    status=cursor.fetchone()
+            self.lag=status['Seconds_Behind_Master'] if status else None
+        except Exception as e:
+            logger.warning('replica {} unavailable: {}'.format(self.host, e))
+            self.lag=None
+        return self.lag
+
+    def usable(self):
+        lag=self.current_lag()
+        return lag is not None and lag <= settings['max_lag']
+
+
+replicas=[]
+
+
+def configure(pin_seconds, max_lag, check_interval):
+    settings.update(
+        pin_seconds=pin_seconds,
+        max_lag=max_lag,
+        check_interval=check_interval,
+    )
+
+
+def add_replica(host, pool, database):
+    replicas.append(Replica(host, pool, database))
+
+
+def release(exc=None):
+    """
+    teardown_request hook, hands back replica engines.
+    """
+    for replica in replicas:
+        replica.database.release(exc)
+
+
+def reinit():
+    """
+    Drops inherited replica connections after a fork.
+    """
+    for replica in replicas:
+        replica.pool.reinit()
+        replica.database.reinit()
+
+
+def pinned():
+    return session.get(PIN_KEY, 0) > time.time()
+
+
+def choose():
+    """
+    before_request hook picking the replica for this request, if any.
+    """
+    g.replica=None
+    if not replicas or request.method not in ('GET', 'HEAD') or pinned():
+        return
+    usable=[replica for replica in replicas if replica.usable()]
+    if usable:
+        g.replica=random.choice(usable)
+
+
+def current():
+    """
+    The replica serving reads for this request, or None for the primary.
+    """
+    if not has_request_context():
+        return None
+    return g.get('replica', None)
+
+
+def pin():
+    """
+    Sends this users reads to the primary for a little while.
+    """
+    if has_request_context() and replicas:
+        session[PIN_KEY]=time.time() + settings['pin_seconds']
@@ -0,0 +1,157 @@
+"""
+Synthetic data for query plan checks and benchmarks.
+
+Fills an (empty) database with a made up social graph. Follows are drawn
+from a power law, so a few users have a great many followers and most have
+a handful, which is the shape that makes feed and notification queries
+interesting. Everything is derived from `seed`, so the same parameters
+always give the same data.
+
+Only ever point this at a scratch database.
+"""
+
+import random
+from datetime import datetime, timedelta
+
+from werkzeug.security import generate_password_hash
+
+from . import raw
+
+PASSWORD='password'
+
+BATCH_SIZE=1000
+
+
+class Params:
+    def __init__(self, users=1000, photos_per_user=10, follows_per_user=30,
+                 power=1.2, accept_ratio=0.9, groups_per_user=0.2,
+                 members_per_group=8, share_ratio=0.1, likes_per_photo=5,
+                 comments_per_photo=2, tags_per_photo=0.5, days=365, seed=0):
+        self.users=users
+        self.photos_per_user=photos_per_user
+        self.follows_per_user=follows_per_user
+        self.power=power
+        self.accept_ratio=accept_ratio
+        self.groups_per_user=groups_per_user
+        self.members_per_group=members_per_group
+        self.share_ratio=share_ratio
+        self.likes_per_photo=likes_per_photo
+        self.comments_per_photo=comments_per_photo
+        self.tags_per_photo=tags_per_photo
+        self.days=days
+        self.seed=seed
+
+
+def username(index):
+    return 'user{:06d}'.format(index)
+
+
+def _insert(table, columns, rows):
+    rows=list(rows)
+    for start in range(0, len(rows), BATCH_SIZE):
+        with raw.transaction() as tx:
+            tx.insert_many(table, columns, rows[start:start + BATCH_SIZE], ignore=True)
+
+
+def _count(rng, mean):
+    """
+    Random count averaging mean, for fractional means too.
+    """
+    whole=int(mean)
+    return whole + (rng.random() < mean - whole)
+
+
+def seed(params=None):
+    """
+    Fills the database with a synthetic graph described by params.
+
+    :return dict: number of rows written per table
+    """
+    params=params or Params()
+    rng=random.Random(params.seed)
+    now=datetime.now().replace(microsecond=0)
+    password=generate_password_hash(PASSWORD)
+    users=[username(i) for i in range(params.users)]
+
+    _insert('Person', ('username', 'password', 'fname', 'lname', 'isPrivate'), (
+        (user, password, 'first{}'.format(i), 'last{}'.format(i), False)
+        for i, user in enumerate(users)
+    ))
+
+    # popularity by rank, so user000000 is the most followed
+    weights=[1 / (rank + 1) ** params.power for rank in range(params.users)]
+    follows=set()
+    for follower in users:
+        for followee in rng.choices(users, weights, k=_count(rng, params.follows_per_user)):
+            if followee != follower:
+                follows.add((follower, followee, rng.random() < params.accept_ratio))
+    _insert('Follow', ('followerUsername', 'followeeUsername', 'acceptedfollow'), follows)
+
+    photos=[]
+    for user in users:
+        for _ in range(_count(rng, params.photos_per_user)):
+            photos.append((
+                user,
+                now - timedelta(seconds=rng.randrange(params.days * 86400)),
+                None,
+                'synthetic photo',
+                rng.random() > params.share_ratio,
+            ))
+    photos.sort(key=lambda photo: photo[1])
+    _insert('Photo', ('photoOwner', 'timestamp', 'filePath', 'caption', 'allFollowers'), photos)
+    photo_rows=raw.fetch_all('SELECT photoID, photoOwner, allFollowers FROM Photo')
+
+    groups=[]
+    for user in users:
+        for n in range(_count(rng, params.groups_per_user)):
+            groups.append(('group{}'.format(n), user))
+    _insert('CloseFriendGroup', ('groupName', 'groupOwner'), groups)
+
+    belongs=set()
+    for group_name, owner in groups:
+        for member in rng.sample(users, min(params.members_per_group, len(users))):
+            belongs.add((group_name, owner, member))
+    _insert('Belong', ('groupName', 'groupOwner', 'username'), belongs)
+
+    groups_of={}
+    for group_name, owner in groups:
+        groups_of.setdefault(owner, []).append(group_name)
+    shares, likes, comments, tags=[], set(), set(), set()
+    for photo in photo_rows:
+        owned=groups_of.get(photo['photoOwner'])
+        if not photo['allFollowers'] and owned:
+            shares.append((rng.choice(owned), photo['photoOwner'], photo['photoID']))
+        for user in rng.sample(users, min(_count(rng, params.likes_per_photo), len(users))):
+            likes.add((user, photo['photoID']))
+        for user in rng.sample(users, min(_count(rng, params.comments_per_photo), len(users))):
+            comments.add((user, photo['photoID'], 'synthetic comment'))
+        for user in rng.sample(users, min(_count(rng, params.tags_per_photo), len(users))):
+            tags.add((user, photo['photoID'], rng.random() < 0.5))
+    _insert('Share', ('groupName', 'groupOwner', 'photoID'), shares)
+    _insert('Liked', ('username', 'photoID'), likes)
+    _insert('Comment', ('username', 'photoID', 'commentText'), comments)
+    _insert('Tag', ('username', 'photoID', 'acceptedTag'), tags)
+
+    # counters on Photo and the precomputed timelines are normally kept
+    # by the request handlers
+    from ..home import counters
+    from ..feed import timeline
+    counters.reconcile()
+    if timeline.enabled():
+        timeline.backfill()
+
+    with raw.transaction() as tx:
+        tx.execute('ANALYZE TABLE Person, Photo, Follow, CloseFriendGroup, Belong, Share, Liked, Tag, Comment')
+        tx.cursor.fetchall()
+
+    return {
+        'Person'          : len(users),
+        'Follow'          : len(follows),
+        'Photo'           : len(photos),
+        'CloseFriendGroup': len(groups),
+        'Belong'          : len(belongs),
+        'Share'           : len(shares),
+        'Liked'           : len(likes),
+        'Comment'         : len(comments),
+        'Tag'             : len(tags),
+    }
@@ -0,0 +1,40 @@
+"""
+Version stamps for in process state.
+
+The follow graph and the search index live in every worker's memory, and a
+worker that changes one has to tell the others. The stamp is a counter row
+in Stamp on the primary, so every worker sees it whatever CACHE_BACKEND is,
+it can not be evicted, and bumping it is a single atomic statement.
+
+Readers compare the stamp they loaded at with the current one, once a
+request, and reload when it moved. A writer bumps it after its write
+commits, and only keeps its in place update as current if the bump moved
+the stamp by exactly one, ie no other worker wrote in between.
+"""
+
+from . import raw
+
+READ='SELECT version FROM Stamp WHERE name = %s'
+
+BUMP=(
+    'INSERT INTO Stamp (name, version) VALUES (%s, 1) '
+    'ON DUPLICATE KEY UPDATE version = version + 1'
+)
+
+
+def read(name):
+    """
+    :return int: current version of name, 0 if it was never bumped
+    """
+    # always the primary, a lagging replica would look like a change
+    rows=raw.fetch_all(READ, (name,), primary=True)
+    return rows[0]['version'] if rows else 0
+
+
+def bump(name):
+    """
+    :return int: the version after this bump
+    """
+    with raw.transaction() as tx:
+        tx.execute(BUMP, (name,))
+        return tx.fetch_all(READ, (name,))[0]['version']
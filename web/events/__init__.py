@@ -0,0 +1,4 @@
+from .events import broker, set_broker, enabled, notification, new_post, \
+    NOTIFICATION, POST
+from .broker import LocalBroker, RedisBroker
+from .routes import pages
@@ -0,0 +1,147 @@
+"""
+Pub/sub for pushing events to connected users.
+
+LocalBroker only reaches subscribers in the same process, which is enough
+for a single worker. RedisBroker publishes through redis and every worker
+hands what it receives to its own subscribers, so an event raised in one
+worker reaches a stream held open by another. Both expose the same
+publish / subscribe interface, see events.set_broker.
+"""
+
+import json
+import logging
+import threading
+from collections import deque
+
+try:
+    import redis
+except ImportError:
+    redis=None
+
+logger=logging.getLogger(__name__)
+
+
+class Subscription:
+    """
+    Events waiting for one open stream. Only the newest max_pending are
+    kept, a client that falls that far behind reloads anyway.
+    """
+
+    def __init__(self, broker, username, max_pending=100):
+        self.broker=broker
+        self.username=username
+        self.pending=deque(maxlen=max_pending)
+        self.condition=threading.Condition()
+
+    def put(self, event):
+        with self.condition:
+            self.pending.append(event)
+            self.condition.notify()
+
+    def get(self, timeout=None):
+        """
+        Next event, waiting up to timeout seconds for one.
+
+        :return: (name, data) or None on timeout
+        """
+        with self.condition:
+            if not self.pending:
+                self.condition.wait(timeout)
+            if not self.pending:
+                return None
+            return self.pending.popleft()
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class LocalBroker:
+    """
+    In process pub/sub keyed by username.
+    """
+
+    def __init__(self):
+        self.subscriptions={}
+        self.lock=threading.Lock()
+
+    def subscribe(self, username):
+        subscription=Subscription(self, username)
+        with self.lock:
+            self.subscriptions.setdefault(username, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            subscribers=self.subscriptions.get(subscription.username)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self.subscriptions[subscription.username]
+
+    def deliver(self, usernames, name, data):
+        with self.lock:
+            targets=[
+                subscription
+                for username in usernames
+                for subscription in self.subscriptions.get(username, ())
+            ]
+        for subscription in targets:
+            subscription.put((name, data))
+
+    def publish(self, usernames, name, data):
+        """
+        :param usernames: users the event is for
+        :param str name: event name, ie 'notification'
+        :param dict data: json serializable payload
+        """
+        self.deliver(usernames, name, data)
+
+
+class RedisBroker(LocalBroker):
+    """
+    Fans events out to every worker through one redis channel. Needs the
+    redis package.
+    """
+
+    def __init__(self, url, channel='ts/events'):
+        if redis is None:
+            raise RuntimeError('EVENTS_BROKER redis needs the redis package installed')
+        super().__init__()
+        self.client=redis.Redis.from_url(url)
+        self.channel=channel
+        self.listener=None
+        self.listener_lock=threading.Lock()
+
+    def subscribe(self, username):
+        self._listen()
+        return super().subscribe(username)
+
+    def publish(self, usernames, name, data):
+        self.client.publish(self.channel, json.dumps({
+            'usernames': list(usernames),
+            'name'     : name,
+            'data'     : data,
+        }))
+
+    def _listen(self):
+        # started on first use rather than in __init__, so the thread
+        # belongs to the worker and not to a master that forks it away
+        with self.listener_lock:
+            if self.listener is not None and self.listener.is_alive():
+                return
+            self.listener=threading.Thread(
+                target=self._run,
+                name='events-listener',
+                daemon=True
+            )
+            self.listener.start()
+
+    def _run(self):
+        pubsub=self.client.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(self.channel)
+        for message in pubsub.listen():
+            try:
+                event=json.loads(message['data'])
+                self.deliver(event['usernames'], event['name'], event['data'])
+            except (ValueError, KeyError, TypeError) as e:
+                logger.warning('dropped malformed event: {}'.format(e))
@@ -0,0 +1,109 @@
+"""
+Events pushed to users with their pages open, so they learn about new
+follow requests, tags and posts without reloading.
+
+Handlers call the publish helpers below after their write commits. Pages
+hold a server sent event stream open on /events/, which is fed by the
+broker. Streams are plain WSGI generators, each one holds a worker thread
+for up to EVENTS_STREAM_SECONDS before the browser reconnects, so this
+is off unless EVENTS_ENABLED is set, which wants gunicorn run with
+WORKER_CLASS=gthread and enough THREADS.
+"""
+
+import json
+import time
+
+from .broker import LocalBroker, RedisBroker
+from ..app import app
+from ..graph import graph
+
+NOTIFICATION='notification'
+POST='post'
+
+
+def _make_broker():
+    if app.config['EVENTS_BROKER'] == 'redis':
+        return RedisBroker(app.config['EVENTS_URL'])
+    return LocalBroker()
+
+
+current=_make_broker()
+
+
+def broker():
+    """
+    The broker currently in use.
+    """
+    return current
+
+
+def set_broker(new_broker):
+    """
+    Swap out the broker, ie for a LocalBroker in tests.
+    """
+    global current
+    current=new_broker
+
+
+def enabled():
+    return app.config['EVENTS_ENABLED']
+
+
+def notification(username, kind, sender):
+    """
+    username has a new pending tag or follow request.
+    """
+    if not enabled():
+        return
+    current.publish([username], NOTIFICATION, {
+        'kind'  : kind,
+        'sender': sender,
+    })
+
+
+def new_post(owner, public, members=()):
+    """
+    owner posted a photo. Goes to accepted followers when it is public
+    and to members of the group it was shared with.
+
+    :param str owner: photoOwner
+    :param bool public: allFollowers
+    :param members: usernames of the group it was shared with
+    """
+    if not enabled():
+        return
+    audience=set(members)
+    if public:
+        audience.update(graph.followers_of(owner))
+    audience.discard(owner)
+    if audience:
+        current.publish(audience, POST, {'owner': owner})
+
+
+def _format(name, data):
+    return 'event: {}\ndata: {}\n\n'.format(name, json.dumps(data))
+
+
+def stream(username):
+    """
+    Server sent events for username. Ends after EVENTS_STREAM_SECONDS,
+    the browser reconnects on its own.
+    """
+    subscription=current.subscribe(username)
+    try:
+        yield 'retry: {}\n\n'.format(app.config['EVENTS_RETRY_MS'])
+        deadline=time.monotonic() + app.config['EVENTS_STREAM_SECONDS']
+        while True:
+            remaining=deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            event=subscription.get(
+                timeout=min(remaining, app.config['EVENTS_HEARTBEAT_SECONDS'])
+            )
+            if event is None:
+                # keeps proxies from timing the connection out
+                yield ': keepalive\n\n'
+            else:
+                yield _format(*event)
+    finally:
+        subscription.close()
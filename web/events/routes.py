@@ -0,0 +1,23 @@
+from flask import Blueprint, Response, abort
+from flask_login import current_user, login_required
+
+from . import events
+
+pages=Blueprint('events', __name__, url_prefix='/events')
+
+
+@pages.route('/')
+@login_required
+def stream():
+    if not events.enabled():
+        abort(404)
+    # the generator runs after the request context is gone,
+    # so take what it needs from the context now
+    return Response(
+        events.stream(current_user.username),
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control'    : 'no-cache',
+            'X-Accel-Buffering': 'no',
+        }
+    )
@@ -0,0 +1,3 @@
+from .feed import visible_photos, page, encode_cursor, decode_cursor
+from .hydrate import hydrate, state_of, tile_variant, PhotoState
+from . import timeline
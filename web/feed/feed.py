@@ -0,0 +1,145 @@
+"""
+Everything that can end up in a users feed comes from one of three places:
+
+    - photos the user posted themselves
+    - public photos of people the user has an accepted follow on
+    - photos shared into a CloseFriendGroup the user belongs to
+
+Rather than walking each of those relationships from python (one query per
+followee and per group share), the whole visible set is resolved by the
+database in a single statement, already ordered newest first.
+"""
+
+from datetime import datetime
+
+from ..app import app, db
+
+# the visible set is built as a derived table of photoIDs, one indexed
+# branch per source, then joined back to Photo on its primary key. An OR
+# of the three conditions on Photo itself can only be answered by scanning
+# every photo.
+VISIBLE_CLAUSE='''
+JOIN (
+    SELECT Photo.photoID
+    FROM Photo
+    WHERE Photo.photoOwner = %s
+    UNION
+    SELECT Photo.photoID
+    FROM Follow
+    JOIN Photo
+      ON Photo.photoOwner = Follow.followeeUsername
+    WHERE Follow.followerUsername = %s
+      AND Follow.acceptedfollow = TRUE
+      AND Photo.allFollowers = TRUE
+    UNION
+    SELECT Share.photoID
+    FROM Belong
+    JOIN Share
+      ON Share.groupName = Belong.groupName
+     AND Share.groupOwner = Belong.groupOwner
+    WHERE Belong.username = %s
+) AS Visible
+  ON Visible.photoID = Photo.photoID
+'''
+
+# keyset condition for (timestamp, photoID) < cursor. Spelled out rather than
+# as a row constructor so the optimizer can range scan on timestamp.
+BEFORE_CLAUSE='''
+WHERE Photo.timestamp < %s
+   OR (Photo.timestamp = %s AND Photo.photoID < %s)
+'''
+
+ORDER_CLAUSE='''
+ORDER BY Photo.timestamp DESC, Photo.photoID DESC
+'''
+
+CURSOR_TIME_FORMAT='%Y-%m-%dT%H:%M:%S'
+
+
+def encode_cursor(photo):
+    """
+    Turns the last photo of a page into an opaque cursor string that
+    can be handed back as ?before= to get the next page.
+
+    :param photo: PhotoModel
+    :return str:
+    """
+    return '{}_{}'.format(
+        photo.timestamp.strftime(CURSOR_TIME_FORMAT),
+        photo.photoID
+    )
+
+
+def decode_cursor(cursor):
+    """
+    Inverse of encode_cursor. Malformed cursors are treated as no cursor
+    at all, so a mangled url just lands on the first page.
+
+    :param str cursor:
+    :return: (datetime, int) or None
+    """
+    if not cursor:
+        return None
+    try:
+        timestamp, photo_id=cursor.rsplit('_', 1)
+        return datetime.strptime(timestamp, CURSOR_TIME_FORMAT), int(photo_id)
+    except ValueError:
+        return None
+
+
+def visible_photos(username, before=None, limit=None):
+    """
+    Selects photos visible to username in one query. The rows come
+    back ordered by timestamp and are hydrated into Photo models by
+    bigsql in bulk.
+
+    :param str username: user the feed is being generated for
+    :param before: (timestamp, photoID) keyset to start strictly after
+    :param int limit: max number of photos to select
+    :return: [ Photo ]
+    """
+    clause=VISIBLE_CLAUSE
+    args=[username] * 3
+
+    if before is not None:
+        timestamp, photo_id=before
+        clause+=BEFORE_CLAUSE
+        args.extend((timestamp, timestamp, photo_id))
+
+    clause+=ORDER_CLAUSE
+
+    if limit is not None:
+        clause+='LIMIT %s\n'
+        args.append(limit)
+
+    return db.query('Photo').append_raw(
+        clause,
+        tuple(args)
+    ).all()
+
+
+def page(username, cursor=None, limit=None):
+    """
+    One page of the feed for username.
+
+    One extra row is selected so we know whether there is anything
+    after this page without a separate COUNT.
+
+    :param str username: user the feed is being generated for
+    :param str cursor: value from a previous pages next cursor
+    :param int limit: page size, defaults to FEED_PAGE_SIZE
+    :return: ([ Photo ], next cursor or None)
+    """
+    from . import timeline
+
+    limit=limit or app.config['FEED_PAGE_SIZE']
+    select=timeline.timeline_photos if timeline.enabled() else visible_photos
+    photos=select(
+        username,
+        before=decode_cursor(cursor),
+        limit=limit + 1
+    )
+    if len(photos) > limit:
+        photos=photos[:limit]
+        return photos, encode_cursor(photos[-1])
+    return photos, None
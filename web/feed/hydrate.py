@@ -0,0 +1,140 @@
+"""
+Bulk loading of the per photo state a feed tile needs.
+
+Drawing a tile wants whether the current user already liked it, the
+comments and the tags. Like and comment counts are read straight off the
+Photo row (see home/counters.py). Asking each photo for those on its
+own is several queries per tile, so for a page of photos we select each
+table once for all of the photoIDs and hand the rows out in python.
+
+Tiles the fragment cache (cache/fragments.py) already holds are drawn
+without their comments and tags, so those are only selected for the rest.
+
+The results live on flask.g for the rest of the request rather than on the
+models themselves, so bigsql never sees them as dirty columns.
+"""
+
+from flask import g
+from flask_login import current_user
+
+from ..app import db
+from ..cache import fragments
+
+
+class PhotoState:
+    """
+    Everything hydrate preloads for a single photo.
+    """
+
+    def __init__(self):
+        self.liked=False
+        self.comments=[]
+        self.tags=[]
+        # False while comments and tags were skipped for a cached tile
+        self.complete=True
+
+
+def _states():
+    if 'photo_state' not in g:
+        g.photo_state={}
+    return g.photo_state
+
+
+def _select_in(table, photo_ids, order='', username=None):
+    clause='WHERE {}.photoID IN ({}) '.format(
+        table,
+        ', '.join(['%s'] * len(photo_ids))
+    )
+    args=tuple(photo_ids)
+    if username is not None:
+        clause+='AND {}.username = %s '.format(table)
+        args+=(username,)
+    return db.query(table).append_raw(clause + order, args).all()
+
+
+def tile_variant(photo, liked):
+    """
+    What a photo tile looks like for the current user, besides the photo
+    itself: whether they own it and whether they liked it.
+    """
+    owner=current_user.is_authenticated and current_user.username == photo.photoOwner
+    return '{}{}'.format(int(owner), int(liked))
+
+
+def _load_comments_and_tags(states):
+    """
+    :param states: { photoID: PhotoState }
+    """
+    photo_ids=list(states)
+    for comment in _select_in('Comment', photo_ids, 'ORDER BY Comment.timestamp'):
+        states[comment.photoID].comments.append(comment)
+
+    for tag in _select_in('Tag', photo_ids):
+        states[tag.photoID].tags.append(tag)
+
+    for state in states.values():
+        state.complete=True
+
+
+def hydrate(photos):
+    """
+    Loads liked state, comments and tags for all of photos with one
+    query per table. Only the current users own likes are selected,
+    and comments and tags are skipped for tiles that are cached.
+
+    :param photos: [ PhotoModel ]
+    :return: photos, for chaining
+    """
+    states=_states()
+    photo_ids=[
+        photo.photoID
+        for photo in photos
+        if photo.photoID not in states
+    ]
+    if len(photo_ids) == 0:
+        return photos
+
+    loaded={
+        photo_id: PhotoState()
+        for photo_id in photo_ids
+    }
+
+    if current_user.is_authenticated:
+        for like in _select_in('Liked', photo_ids, username=current_user.username):
+            loaded[like.photoID].liked=True
+
+    fragments.versions('photo', photo_ids)
+    drawn={}
+    for photo in photos:
+        state=loaded.get(photo.photoID)
+        if state is None:
+            continue
+        if fragments.cached('photo', photo.photoID, tile_variant(photo, state.liked)):
+            state.complete=False
+        else:
+            drawn[photo.photoID]=state
+    if drawn:
+        _load_comments_and_tags(drawn)
+
+    states.update(loaded)
+    return photos
+
+
+def state_of(photo, complete=True):
+    """
+    Preloaded state for photo. Photos that were not part of a
+    hydrated page get loaded on their own.
+
+    :param photo: PhotoModel
+    :param bool complete: load comments and tags if they were skipped,
+        False when only liked is wanted
+    :return PhotoState:
+    """
+    states=_states()
+    if photo.photoID not in states:
+        hydrate([photo])
+    state=states[photo.photoID]
+    if complete and not state.complete:
+        # the cached tile was evicted since hydrate looked
+        _load_comments_and_tags({photo.photoID: state})
+    return state
@@ -0,0 +1,298 @@
+"""
+Fan out on write feeds.
+
+visible_photos resolves the feed at read time, which gets slower the more
+people a user follows. With FEED_TIMELINE on, each post is instead copied
+into a Timeline row for every reader when it is created, and a feed page is
+a range scan of the readers own rows.
+
+Users with more than TIMELINE_FANOUT_LIMIT followers are not fanned out to
+their followers, a post would otherwise mean thousands of rows written in
+the upload request. Their followers pick those posts up at read time
+instead, the same way visible_photos does. Their own rows and group shares
+are still written.
+
+The follow and group handlers keep the table in step:
+
+    - follow accepted   -> the followees public photos are copied in
+    - unfollow          -> rows no longer visible are deleted
+    - member added      -> the groups shares are copied in
+    - member removed    -> rows no longer visible are deleted
+    - photo deleted     -> ON DELETE CASCADE
+
+`flask backfill-timeline` rebuilds the whole table from scratch.
+"""
+
+import click
+
+from .feed import ORDER_CLAUSE
+from ..app import app, db
+from ..database import raw
+from ..graph import graph
+
+# every (reader, photo) pair that is still visible. Used to prune rows
+# after an unfollow or removal from a group.
+STILL_VISIBLE='''
+(
+    Photo.photoOwner = Timeline.username
+ OR (Photo.allFollowers = TRUE AND EXISTS (
+        SELECT 1
+        FROM Follow
+        WHERE Follow.followerUsername = Timeline.username
+          AND Follow.followeeUsername = Photo.photoOwner
+          AND Follow.acceptedfollow = TRUE
+    ))
+ OR EXISTS (
+        SELECT 1
+        FROM Share
+        JOIN Belong
+          ON Belong.groupName = Share.groupName
+         AND Belong.groupOwner = Share.groupOwner
+        WHERE Share.photoID = Photo.photoID
+          AND Belong.username = Timeline.username
+    )
+)
+'''
+
+# owners that are read at request time rather than fanned out
+HEAVY_OWNERS='''
+SELECT followeeUsername
+FROM Follow
+WHERE acceptedfollow = TRUE
+GROUP BY followeeUsername
+HAVING COUNT(*) > %s
+'''
+
+
+def enabled():
+    return app.config['FEED_TIMELINE']
+
+
+def _limit():
+    return app.config['TIMELINE_FANOUT_LIMIT']
+
+
+def _keyset(table):
+    return (
+        'AND ({0}.timestamp < %s '
+        'OR ({0}.timestamp = %s AND {0}.photoID < %s))\n'.format(table)
+    )
+
+
+def fan_out(tx, photo_id, owner, public):
+    """
+    Writes the Timeline rows for a new photo. Runs inside the
+    transaction that inserted the photo, so the two commit together.
+
+    :param tx: raw.Transaction the Photo row was inserted in
+    :param int photo_id:
+    :param str owner: photoOwner
+    :param bool public: allFollowers
+    """
+    if not enabled():
+        return
+
+    audience=['SELECT %s AS username']
+    args=[owner]
+
+    if public and graph.follower_count(owner) <= _limit():
+        audience.append(
+            'SELECT followerUsername FROM Follow '
+            'WHERE followeeUsername = %s AND acceptedfollow = TRUE'
+        )
+        args.append(owner)
+
+    audience.append(
+        'SELECT Belong.username FROM Share '
+        'JOIN Belong ON Belong.groupName = Share.groupName '
+        'AND Belong.groupOwner = Share.groupOwner '
+        'WHERE Share.photoID = %s'
+    )
+    args.append(photo_id)
+
+    tx.execute(
+        'INSERT IGNORE INTO Timeline (username, photoID, timestamp) '
+        'SELECT Audience.username, Photo.photoID, Photo.timestamp '
+        'FROM Photo JOIN ({}) AS Audience '
+        'WHERE Photo.photoID = %s'.format(' UNION '.join(audience)),
+        tuple(args) + (photo_id,)
+    )
+
+
+def follow_accepted(follower, followee):
+    """
+    Copies the public photos of followee into followers timeline.
+    Call after the follow has been committed and added to the graph.
+    """
+    if not enabled() or graph.follower_count(followee) > _limit():
+        return
+    with raw.transaction() as tx:
+        tx.execute(
+            'INSERT IGNORE INTO Timeline (username, photoID, timestamp) '
+            'SELECT %s, photoID, timestamp FROM Photo '
+            'WHERE photoOwner = %s AND allFollowers = TRUE',
+            (follower, followee)
+        )
+
+
+def unfollowed(follower, followee):
+    """
+    Drops photos of followee that follower can no longer see. Call
+    after the unfollow has been committed and removed from the graph.
+    """
+    if not enabled():
+        return
+    with raw.transaction() as tx:
+        tx.execute(
+            'DELETE FROM Timeline USING Timeline '
+            'JOIN Photo ON Photo.photoID = Timeline.photoID '
+            'WHERE Timeline.username = %s AND Photo.photoOwner = %s '
+            'AND NOT ' + STILL_VISIBLE,
+            (follower, followee)
+        )
+
+        # followee just dropped back under the limit. Their posts were
+        # read at request time until now, so their followers timelines
+        # are missing them.
+        if graph.follower_count(followee) == _limit():
+            tx.execute(
+                'INSERT IGNORE INTO Timeline (username, photoID, timestamp) '
+                'SELECT Follow.followerUsername, Photo.photoID, Photo.timestamp '
+                'FROM Follow JOIN Photo ON Photo.photoOwner = Follow.followeeUsername '
+                'WHERE Follow.followeeUsername = %s AND Follow.acceptedfollow = TRUE '
+                'AND Photo.allFollowers = TRUE',
+                (followee,)
+            )
+
+
+def member_added(usernames, group_name, group_owner):
+    """
+    Copies the groups shares into the timelines of new members.
+    """
+    if not enabled() or not usernames:
+        return
+    with raw.transaction() as tx:
+        tx.execute(
+            'INSERT IGNORE INTO Timeline (username, photoID, timestamp) '
+            'SELECT Belong.username, Photo.photoID, Photo.timestamp FROM Share '
+            'JOIN Belong ON Belong.groupName = Share.groupName '
+            'AND Belong.groupOwner = Share.groupOwner '
+            'JOIN Photo ON Photo.photoID = Share.photoID '
+            'WHERE Share.groupName = %s AND Share.groupOwner = %s '
+            'AND Belong.username IN ({})'.format(raw.placeholders(usernames)),
+            (group_name, group_owner) + tuple(usernames)
+        )
+
+
+def member_removed(usernames, group_name, group_owner):
+    """
+    Drops the groups shares from former members timelines, unless
+    they can still see them some other way.
+    """
+    if not enabled() or not usernames:
+        return
+    with raw.transaction() as tx:
+        tx.execute(
+            'DELETE FROM Timeline USING Timeline '
+            'JOIN Share ON Share.photoID = Timeline.photoID '
+            'JOIN Photo ON Photo.photoID = Timeline.photoID '
+            'WHERE Timeline.username IN ({}) '
+            'AND Share.groupName = %s AND Share.groupOwner = %s '
+            'AND NOT '.format(raw.placeholders(usernames)) + STILL_VISIBLE,
+            tuple(usernames) + (group_name, group_owner)
+        )
+
+
+def timeline_photos(username, before=None, limit=None):
+    """
+    Same result as feed.visible_photos, read from Timeline plus
+    the public photos of any heavy accounts username follows.
+
+    :param str username: user the feed is being generated for
+    :param before: (timestamp, photoID) keyset to start strictly after
+    :param int limit: max number of photos to select
+    :return: [ Photo ]
+    """
+    branches=[]
+    args=[]
+
+    def branch(sql, branch_args, table):
+        if before is not None:
+            timestamp, photo_id=before
+            sql+=_keyset(table)
+            branch_args+=[timestamp, timestamp, photo_id]
+        if limit is not None:
+            sql+='ORDER BY {0}.timestamp DESC, {0}.photoID DESC LIMIT %s\n'.format(table)
+            branch_args.append(limit)
+        branches.append('(' + sql + ')')
+        args.extend(branch_args)
+
+    branch(
+        'SELECT Timeline.photoID FROM Timeline WHERE Timeline.username = %s\n',
+        [username],
+        'Timeline'
+    )
+
+    heavy=graph.heavy_followees(username, _limit())
+    if heavy:
+        branch(
+            'SELECT Photo.photoID FROM Photo WHERE Photo.photoOwner IN ({}) '
+            'AND Photo.allFollowers = TRUE\n'.format(raw.placeholders(heavy)),
+            list(heavy),
+            'Photo'
+        )
+
+    clause='JOIN (\n{}\n) AS Visible\n  ON Visible.photoID = Photo.photoID\n'.format(
+        '\nUNION\n'.join(branches)
+    )
+    clause+=ORDER_CLAUSE
+    if limit is not None:
+        clause+='LIMIT %s\n'
+        args.append(limit)
+
+    return db.query('Photo').append_raw(
+        clause,
+        tuple(args)
+    ).all()
+
+
+def backfill():
+    """
+    Rebuilds Timeline from Photo, Follow and Share.
+
+    :return int: number of rows written
+    """
+    with raw.transaction() as tx:
+        tx.execute('DELETE FROM Timeline')
+        tx.execute(
+            'INSERT IGNORE INTO Timeline (username, photoID, timestamp) '
+            'SELECT photoOwner, photoID, timestamp FROM Photo'
+        )
+        written=tx.rowcount
+        tx.execute(
+            'INSERT IGNORE INTO Timeline (username, photoID, timestamp) '
+            'SELECT Follow.followerUsername, Photo.photoID, Photo.timestamp '
+            'FROM Follow JOIN Photo ON Photo.photoOwner = Follow.followeeUsername '
+            'WHERE Follow.acceptedfollow = TRUE AND Photo.allFollowers = TRUE '
+            'AND Follow.followeeUsername NOT IN (' + HEAVY_OWNERS + ')',
+            (_limit(),)
+        )
+        written+=tx.rowcount
+        tx.execute(
+            'INSERT IGNORE INTO Timeline (username, photoID, timestamp) '
+            'SELECT Belong.username, Photo.photoID, Photo.timestamp '
+            'FROM Share '
+            'JOIN Belong ON Belong.groupName = Share.groupName '
+            'AND Belong.groupOwner = Share.groupOwner '
+            'JOIN Photo ON Photo.photoID = Share.photoID'
+        )
+        written+=tx.rowcount
+    return written
+
+
+@app.cli.command('backfill-timeline')
+def backfill_command():
+    """
+    Rebuilds the precomputed feed table.
+    """
+    click.echo('wrote {} timeline rows'.format(backfill()))
@@ -0,0 +1 @@
+from .graph import graph, FollowGraph, FOLLOWING, PENDING, NOT_FOLLOWING
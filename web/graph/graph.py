@@ -0,0 +1,232 @@
+"""
+In memory follow graph.
+
+Every Follow row is loaded once per worker into per user bitsets keyed by a
+small integer id, one for accepted followees, one for pending requests and
+one for accepted followers. Checking whether a follows b is then a shift and
+a mask rather than a SELECT, and a whole page of users can be checked
+without touching the database.
+
+The follow handlers update the graph in place after they commit. Workers
+notice each others writes through a version stamp in the database (see
+database/stamps.py), and reload the graph from Follow when it moves.
+"""
+
+import logging
+import os
+import threading
+
+from flask import g, has_request_context
+
+from ..database import raw, stamps
+
+logger=logging.getLogger(__name__)
+
+FOLLOWING='following'
+PENDING='pending'
+NOT_FOLLOWING='none'
+
+STAMP='follow-graph'
+
+LOAD='SELECT followerUsername, followeeUsername, acceptedfollow FROM Follow'
+
+
+class FollowGraph:
+    def __init__(self):
+        self.ids={}
+        self.names=[]
+        self.accepted={}
+        self.pending={}
+        self.followers={}
+        self.version=None
+        self.pid=None
+        self.lock=threading.RLock()
+
+    def _id(self, username):
+        uid=self.ids.get(username)
+        if uid is None:
+            uid=self.ids[username]=len(self.ids)
+            self.names.append(username)
+        return uid
+
+    def _add(self, follower, followee, accepted):
+        f, e=self._id(follower), self._id(followee)
+        if accepted:
+            self.pending[f]=self.pending.get(f, 0) & ~(1 << e)
+            self.accepted[f]=self.accepted.get(f, 0) | (1 << e)
+            self.followers[e]=self.followers.get(e, 0) | (1 << f)
+        else:
+            self.pending[f]=self.pending.get(f, 0) | (1 << e)
+
+    def _remove(self, follower, followee):
+        f, e=self._id(follower), self._id(followee)
+        self.pending[f]=self.pending.get(f, 0) & ~(1 << e)
+        self.accepted[f]=self.accepted.get(f, 0) & ~(1 << e)
+        self.followers[e]=self.followers.get(e, 0) & ~(1 << f)
+
+    def _rows(self):
+        """
+        (follower, followee, accepted) for every row in Follow.
+        """
+        # from the primary, so the rows are at least as new as the stamp
+        for row in raw.fetch_all(LOAD, primary=True):
+            yield row['followerUsername'], row['followeeUsername'], bool(row['acceptedfollow'])
+
+    def load(self):
+        """
+        (Re)builds the graph from every row in Follow.
+        """
+        with self.lock:
+            # read before the rows, a write landing in between
+            # only makes the next check reload again
+            version=stamps.read(STAMP)
+            self.ids.clear()
+            self.names.clear()
+            self.accepted.clear()
+            self.pending.clear()
+            self.followers.clear()
+            for follower, followee, accepted in self._rows():
+                self._add(follower, followee, accepted)
+            self.version=version
+            self.pid=os.getpid()
+            logger.debug('loaded follow graph for {} users'.format(len(self.ids)))
+
+    def _stale(self):
+        return self.pid != os.getpid() or self.version != stamps.read(STAMP)
+
+    def ensure_fresh(self):
+        """
+        Loads the graph if this process has not yet, or if another worker
+        changed it since. The stamp is only checked once a request.
+        """
+        if has_request_context():
+            if g.get('follow_graph_checked', False):
+                return
+            g.follow_graph_checked=True
+
+        if self._stale():
+            self.load()
+
+    def _write(self, change):
+        """
+        Applies a committed change in place and bumps the stamp. If another
+        worker wrote since the graph was loaded it is reloaded first. The
+        reload already has the change from Follow, applying it again is
+        harmless.
+        """
+        with self.lock:
+            if self._stale():
+                self.load()
+            change()
+            version=stamps.bump(STAMP)
+            # anything but the next version means another worker wrote in
+            # between, leaving self.version behind makes the next check reload
+            if version == self.version + 1:
+                self.version=version
+
+    def requested(self, follower, followee):
+        """
+        A new, not yet accepted, follow request.
+        """
+        self._write(lambda: self._add(follower, followee, accepted=False))
+
+    def accepted_follow(self, follower, followee):
+        self._write(lambda: self._add(follower, followee, accepted=True))
+
+    def removed(self, follower, followee):
+        """
+        Rejected request or unfollow.
+        """
+        self._write(lambda: self._remove(follower, followee))
+
+    def state(self, follower, followee):
+        """
+        :return: FOLLOWING, PENDING or NOT_FOLLOWING
+        """
+        self.ensure_fresh()
+        f, e=self.ids.get(follower), self.ids.get(followee)
+        if f is None or e is None:
+            return NOT_FOLLOWING
+        if (self.accepted.get(f, 0) >> e) & 1:
+            return FOLLOWING
+        if (self.pending.get(f, 0) >> e) & 1:
+            return PENDING
+        return NOT_FOLLOWING
+
+    def follows(self, follower, followee):
+        """
+        True if follower has an accepted follow on followee.
+        """
+        return self.state(follower, followee) == FOLLOWING
+
+    def follows_many(self, viewer, usernames):
+        """
+        Follow state of viewer for each of usernames, without
+        going to the database.
+
+        :return: { username: state }
+        """
+        self.ensure_fresh()
+        f=self.ids.get(viewer)
+        accepted=self.accepted.get(f, 0)
+        pending=self.pending.get(f, 0)
+        states={}
+        for username in usernames:
+            e=self.ids.get(username)
+            if e is not None and (accepted >> e) & 1:
+                states[username]=FOLLOWING
+            elif e is not None and (pending >> e) & 1:
+                states[username]=PENDING
+            else:
+                states[username]=NOT_FOLLOWING
+        return states
+
+    def follower_count(self, username):
+        self.ensure_fresh()
+        e=self.ids.get(username)
+        if e is None:
+            return 0
+        return bin(self.followers.get(e, 0)).count('1')
+
+    def followers_of(self, username):
+        """
+        Accepted followers of username.
+
+        :return: [ username ]
+        """
+        self.ensure_fresh()
+        e=self.ids.get(username)
+        if e is None:
+            return []
+        followers=self.followers.get(e, 0)
+        names=[]
+        f=0
+        while followers:
+            if followers & 1:
+                names.append(self.names[f])
+            followers>>=1
+            f+=1
+        return names
+
+    def heavy_followees(self, viewer, limit):
+        """
+        Accepted followees of viewer with more than limit followers.
+
+        :return: [ username ]
+        """
+        self.ensure_fresh()
+        f=self.ids.get(viewer)
+        if f is None:
+            return []
+        accepted=self.accepted.get(f, 0)
+        heavy=[]
+        e=0
+        while accepted:
+            if accepted & 1 and bin(self.followers.get(e, 0)).count('1') > limit:
+                heavy.append(self.names[e])
+            accepted>>=1
+            e+=1
+        return heavy
+
+
+graph=FollowGraph()
@@ -24,9 +24,8 @@ class AddMemberForm(FlaskForm):
         default='add',
         validators=[DataRequired()]
     )
-    members = SelectField(
-        'Add User To Group',
-        default=('', '---'),
+    members = SelectMultipleField(
+        'Add Users To Group',
         validators=[DataRequired()]
     )
     submit = SubmitField('Submit')
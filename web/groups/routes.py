@@ -6,7 +6,10 @@ from flask_login import login_required, current_user
 
 import bigsql
 from .forms import UpdateGroupForm, NewGroupForm, AddMemberForm, UpdateMemberForm
+from .. import cache
+from .. import feed
 from ..app import db
+from ..database import raw
 
 groups=Blueprint('groups', __name__, url_prefix='/g')
 
@@ -53,28 +56,51 @@ def handle_new_group(new_form):
 
 @validate
 def handle_delete_member(update_form, group):
-    db.query('Belong').delete(
-        groupName=group.groupName,
-        groupOwner=group.groupOwner,
-        username=update_form.member_name.data,
-    )
+    username=update_form.member_name.data
     try:
-        db.session.commit()
-    except bigsql.big_ERROR:
-        db.session.rollback()
+        with raw.transaction() as tx:
+            tx.delete(
+                'Belong',
+                groupName=group.groupName,
+                groupOwner=group.groupOwner,
+                username=username,
+            )
+    except pymysql.err.MySQLError:
+        # already rolled back by raw.transaction
+        flash('unable to remove {}'.format(username))
+        return
+    feed.timeline.member_removed(
+        [username],
+        group.groupName,
+        group.groupOwner
+    )
+    cache.invalidate_memberships(username)
 
 
 @validate
 def handle_new_member(new_form, group):
-    db.query('Belong').new(
-        groupName=group.groupName,
-        groupOwner=group.groupOwner,
-        username=new_form.members.data,
-    )
+    usernames=new_form.members.data
+    # every selected member goes in with one multi row INSERT
     try:
-        db.session.commit()
-    except bigsql.big_ERROR:
-        db.session.rollback()
+        with raw.transaction() as tx:
+            for username in usernames:
+                tx.add(
+                    'Belong',
+                    ignore=True,
+                    groupName=group.groupName,
+                    groupOwner=group.groupOwner,
+                    username=username,
+                )
+    except pymysql.err.MySQLError:
+        # already rolled back by raw.transaction
+        flash('unable to add members')
+        return
+    feed.timeline.member_added(
+        usernames,
+        group.groupName,
+        group.groupOwner
+    )
+    cache.invalidate_memberships(*usernames)
 
 
 @groups.route('/manage', methods=['GET', 'POST'])
@@ -140,15 +166,11 @@ def view():
     new_form=AddMemberForm()
 
     new_form.members.choices=[
-        ('',) * 2
-    ]
-    new_form.members.choices.extend(
         (follower.followeeUsername,) * 2
         for follower in db.query('Follow').find(
             followerUsername=current_user.username
         ).all()
-    )
-    new_form.members.default=('---',) * 2
+    ]
 
     if request.method == 'POST':
         try:
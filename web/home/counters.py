@@ -0,0 +1,89 @@
+"""
+Like and comment counters on Photo.
+
+Photo.likeCount and Photo.commentCount are bumped in the same transaction
+as the Liked / Comment row they count, so they can never be seen out of
+step with it. reconcile() recomputes them all in bulk in case anything
+ever writes those tables some other way.
+"""
+
+import click
+
+from ..app import app
+from ..database import raw
+
+RECONCILE='''
+UPDATE Photo
+LEFT JOIN (
+    SELECT photoID, COUNT(*) AS n FROM Liked GROUP BY photoID
+) AS Likes
+  ON Likes.photoID = Photo.photoID
+LEFT JOIN (
+    SELECT photoID, COUNT(*) AS n FROM Comment GROUP BY photoID
+) AS Comments
+  ON Comments.photoID = Photo.photoID
+SET Photo.likeCount = COALESCE(Likes.n, 0),
+    Photo.commentCount = COALESCE(Comments.n, 0)
+WHERE Photo.likeCount <> COALESCE(Likes.n, 0)
+   OR Photo.commentCount <> COALESCE(Comments.n, 0)
+'''
+
+
+def toggle_like(username, photo_id):
+    """
+    Likes photo_id as username, or unlikes it if it already was.
+
+    :return bool: True if the photo is now liked
+    """
+    with raw.transaction() as tx:
+        tx.execute(
+            'DELETE FROM Liked WHERE username = %s AND photoID = %s',
+            (username, photo_id)
+        )
+        if tx.rowcount:
+            tx.execute(
+                'UPDATE Photo SET likeCount = likeCount - 1 WHERE photoID = %s',
+                (photo_id,)
+            )
+            return False
+
+        tx.execute(
+            'INSERT INTO Liked (username, photoID) VALUES (%s, %s)',
+            (username, photo_id)
+        )
+        tx.execute(
+            'UPDATE Photo SET likeCount = likeCount + 1 WHERE photoID = %s',
+            (photo_id,)
+        )
+        return True
+
+
+def add_comment(username, photo_id, text):
+    with raw.transaction() as tx:
+        tx.execute(
+            'INSERT INTO Comment (username, photoID, commentText) VALUES (%s, %s, %s)',
+            (username, photo_id, text)
+        )
+        tx.execute(
+            'UPDATE Photo SET commentCount = commentCount + 1 WHERE photoID = %s',
+            (photo_id,)
+        )
+
+
+def reconcile():
+    """
+    Recomputes every counter from Liked and Comment.
+
+    :return int: number of photos whose counters had drifted
+    """
+    with raw.transaction() as tx:
+        tx.execute(RECONCILE)
+        return tx.rowcount
+
+
+@app.cli.command('reconcile-counters')
+def reconcile_command():
+    """
+    Repairs drifted like and comment counters.
+    """
+    click.echo('{} photos had drifted counters'.format(reconcile()))
@@ -1,11 +1,8 @@
-from flask_login import current_user
 from flask_wtf import FlaskForm
 from wtforms.fields import StringField, SubmitField, FileField, BooleanField, SelectField, HiddenField
 from wtforms.validators import DataRequired, InputRequired, Optional
 from wtforms.widgets import TextArea
 
-from ..app import db
-
 
 class PostForm(FlaskForm):
     action=HiddenField(
@@ -91,9 +88,6 @@ class LikeForm(FlaskForm):
     @staticmethod
     def populate(photo):
         form=LikeForm()
-        form.liked=int(db.query('Liked').find(
-            username=current_user.username,
-            photoID=photo.photoID
-        ).first() is not None)
+        form.liked=int(photo.state.liked)
         form.id.data=photo.photoID
         return form
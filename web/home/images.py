@@ -0,0 +1,77 @@
+"""
+Serving stored uploads.
+
+Everything under UPLOAD_DIR is stored by content (see ingest.storage), so a
+url never changes what it points at. Responses are marked immutable with
+a strong ETag, and answer conditional and Range requests.
+
+With IMAGE_OFFLOAD set the worker only checks the path and sets headers,
+the front proxy streams the file itself:
+
+    'x-accel-redirect': nginx, redirected to IMAGE_OFFLOAD_PREFIX + path
+    'x-sendfile'      : apache / lighttpd, given the absolute path
+"""
+
+import mimetypes
+import os
+
+from flask import abort, request, Response
+from werkzeug.wsgi import wrap_file
+
+from .. import metrics
+from ..app import app
+
+IMMUTABLE='public, max-age=31536000, immutable'
+
+
+def resolve(path):
+    """
+    Absolute path of path under UPLOAD_DIR, refusing
+    anything that would step outside of it.
+    """
+    root=os.path.realpath(app.config['UPLOAD_DIR'])
+    full=os.path.realpath(os.path.join(root, path))
+    if os.path.commonpath((root, full)) != root or not os.path.isfile(full):
+        abort(404)
+    return full
+
+
+def send_image(path):
+    full=resolve(path)
+    stat=os.stat(full)
+    mimetype=mimetypes.guess_type(full)[0] or 'application/octet-stream'
+    offload=app.config['IMAGE_OFFLOAD']
+
+    if offload == 'x-accel-redirect':
+        rv=Response(mimetype=mimetype)
+        rv.headers['X-Accel-Redirect']=app.config['IMAGE_OFFLOAD_PREFIX'] + path
+    elif offload == 'x-sendfile':
+        rv=Response(mimetype=mimetype)
+        rv.headers['X-Sendfile']=full
+    else:
+        rv=Response(
+            wrap_file(request.environ, open(full, 'rb')),
+            mimetype=mimetype,
+            direct_passthrough=True
+        )
+        rv.content_length=stat.st_size
+
+    # the file name is the content hash, so it doubles as a strong etag
+    rv.set_etag(os.path.basename(full))
+    rv.last_modified=int(stat.st_mtime)
+    rv.headers['Cache-Control']=IMMUTABLE
+
+    if offload:
+        # the proxy does ranges itself
+        rv=rv.make_conditional(request)
+        if rv.status_code == 200:
+            metrics.image_served(stat.st_size, offloaded=True)
+        return rv
+    rv=rv.make_conditional(
+        request,
+        accept_ranges=True,
+        complete_length=stat.st_size
+    )
+    if rv.status_code in (200, 206):
+        metrics.image_served(rv.content_length or 0)
+    return rv
@@ -1,13 +1,20 @@
 from functools import wraps
 
 import pymysql.cursors
-from flask import flash, render_template, Blueprint, send_from_directory, request
+from flask import flash, render_template, Blueprint, request, Response, \
+    stream_with_context, get_flashed_messages
 from flask_login import current_user, login_required
 
 import bigsql
+from . import counters
 from .forms import PostForm, DeleteForm, CommentForm, LikeForm
+from .images import send_image
+from .. import cache
+from .. import feed
+from .. import ingest
 from .. import models
 from ..app import app, db
+from .. import notifications
 from ..notifications import enable_notifications
 
 home=Blueprint('home', __name__, url_prefix='/')
@@ -46,9 +53,23 @@ def handle_delete(form):
         flash('invalid photo')
         return
     if photo.photoOwner == current_user.username:
+        file_path=photo.filePath
+        # pending tags go with the photo, and so do their notifications
+        tagged=[
+            tag.username
+            for tag in db.query('Tag').find(
+                photoID=photo.photoID,
+                acceptedTag=False
+            ).all()
+        ]
         db.session.delete(photo)
         try:
             db.session.commit()
+            # other photos may still point at the same image
+            ingest.storage.release(file_path)
+            for username in tagged:
+                notifications.inbox.changed(username, -1)
+            cache.fragments.bump('photo', photo.photoID)
         except bigsql.big_ERROR:
             db.session.rollback()
     else:
@@ -63,37 +84,33 @@ def handle_comment(form):
     if photo is None:
         flash('invalid photo')
         return
-    c=db.query('Comment').new(
-        username=current_user.username,
-        photoID=photo.photoID,
-        commentText=form.content.data
+    counters.add_comment(
+        current_user.username,
+        photo.photoID,
+        form.content.data
     )
-    db.session.add(c)
-    try:
-        db.session.commit()
-    except bigsql.big_ERROR:
-        db.session.rollback()
+    cache.fragments.bump('photo', photo.photoID)
 
 
 @validate
 def handle_like(form):
-    like=db.query('Liked').find(
-        username=current_user.username,
-        photoID=form.id.data
-    ).first()
+    counters.toggle_like(
+        current_user.username,
+        form.id.data
+    )
+    cache.fragments.bump('photo', form.id.data)
 
-    if like is None:  # like
-        db.query('Liked').new(
-            username=current_user.username,
-            photoID=form.id.data
-        )
-    else:  # unlike
-        db.session.delete(like)
 
-    try:
-        db.session.commit()
-    except bigsql.big_ERROR:
-        db.session.rollback()
+def stream_template(template_name, **context):
+    """
+    render_template, but yields the page in chunks as jinja gets to them
+    rather than building the whole string first.
+    """
+    app.update_template_context(context)
+    template=app.jinja_env.get_template(template_name)
+    stream=template.stream(context)
+    stream.enable_buffering(5)
+    return stream
 
 
 def handle_photos(func):
@@ -131,7 +148,7 @@ def index():
             groupOwner=current_user.username
     ).all():
         group_choices.add((group.groupName,) * 2)
-    for b in current_user.belongs:
+    for b in current_user.memberships:
         group_choices.add((b.groupName,) * 2)
     post_form.group.choices=list(group_choices)
 
@@ -145,17 +162,33 @@ def index():
         except pymysql.err.IntegrityError:
             db.session.rollback()
 
+    photos, next_cursor=feed.page(
+        current_user.username,
+        cursor=request.args.get('before', default=None),
+    )
+    feed.hydrate(photos)
+
+    context=dict(
+        post_form=post_form,
+        photos=photos,
+        next_cursor=next_cursor,
+    )
+
+    if app.config['FEED_STREAMING']:
+        # pop flashes now, the session has already been
+        # saved by the time the template gets to them
+        get_flashed_messages()
+        return Response(stream_with_context(
+            stream_template('home/index.html', **context)
+        ))
+
     return render_template(
         'home/index.html',
-        post_form=post_form,
-        photos=models.Photo.visible_to(current_user.username)
+        **context
     )
 
 
 @home.route('/img/<path:path>')
 # @login_required
 def img(path):
-    return send_from_directory(
-        app.config['UPLOAD_DIR'],
-        path
-    )
+    return send_image(path)
@@ -0,0 +1,3 @@
+from .ingest import sniff, spool, submit, finalize, recover
+from . import derivatives
+from . import storage
@@ -0,0 +1,133 @@
+"""
+Resized copies of uploaded images.
+
+For every stored upload we keep a copy at each of DERIVATIVE_WIDTHS, in the
+original format and in DERIVATIVE_FORMAT, next to the original:
+
+    <name>.<ext>  ->  <name>.320.<ext>, <name>.320.webp, <name>.640.<ext>, ...
+
+They are made in a process pool once an upload has been ingested, since
+resizing is cpu bound. Images narrower than a width are not scaled up, and
+gifs are left alone so they keep their animation. Photo.image_link falls
+back to the original for anything that has no derivative yet.
+"""
+
+import logging
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+
+import click
+
+from ..app import app
+
+try:
+    from PIL import Image
+except ImportError:
+    Image=None
+
+logger=logging.getLogger(__name__)
+
+DERIVATIVE_NAME=re.compile(r'^[^.]+\.\d+\.\w+$')
+
+PIL_FORMATS={
+    'png' : 'PNG',
+    'jpeg': 'JPEG',
+    'webp': 'WEBP',
+}
+
+_pool=None
+_pool_pid=None
+
+
+def pool():
+    global _pool, _pool_pid
+    if _pool is None or _pool_pid != os.getpid():
+        _pool=ProcessPoolExecutor(max_workers=app.config['DERIVATIVE_WORKERS'])
+        _pool_pid=os.getpid()
+    return _pool
+
+
+def derivative_path(path, width, fmt=None):
+    """
+    Where the derivative of path at width is kept.
+
+    :param str path: path of the original
+    :param int width:
+    :param str fmt: image format, defaults to the originals
+    """
+    stem, ext=os.path.splitext(path)
+    return '{}.{}.{}'.format(stem, width, fmt or ext[1:])
+
+
+def generate(path):
+    """
+    Writes any missing derivatives of the image at path.
+
+    :return: [ path of each derivative written ]
+    """
+    ext=os.path.splitext(path)[1][1:]
+    if Image is None or ext not in PIL_FORMATS:
+        return []
+
+    written=[]
+    with Image.open(path) as original:
+        image=original.convert('RGBA' if ext == 'png' else 'RGB')
+        for width in app.config['DERIVATIVE_WIDTHS']:
+            if width >= image.width:
+                continue
+            height=round(image.height * width / image.width)
+            resized=None
+            for fmt in (ext, app.config['DERIVATIVE_FORMAT']):
+                target=derivative_path(path, width, fmt)
+                if os.path.exists(target):
+                    continue
+                if resized is None:
+                    resized=image.resize((width, height), Image.LANCZOS)
+                # write then rename, so a half written file is never served
+                partial=target + '.part'
+                resized.save(partial, PIL_FORMATS[fmt], quality=app.config['DERIVATIVE_QUALITY'])
+                os.replace(partial, target)
+                written.append(target)
+    return written
+
+
+def _generate(path):
+    try:
+        return generate(path)
+    except Exception:
+        logger.exception('unable to make derivatives of {}'.format(path))
+        return []
+
+
+def submit(path):
+    """
+    Queues derivative generation for a freshly stored upload.
+    """
+    if Image is None:
+        return None
+    return pool().submit(_generate, path)
+
+
+def originals(root):
+    """
+    Every stored upload under root, skipping derivatives.
+    """
+    for dirpath, _, filenames in os.walk(root):
+        for filename in filenames:
+            if DERIVATIVE_NAME.match(filename) is None and not filename.endswith('.part'):
+                yield os.path.join(dirpath, filename)
+
+
+@app.cli.command('backfill-derivatives')
+def backfill_command():
+    """
+    Makes derivatives for uploads stored before they existed.
+    """
+    if Image is None:
+        raise click.ClickException('Pillow is needed to make derivatives')
+    paths=list(originals(app.config['UPLOAD_DIR']))
+    written=0
+    for done in pool().map(_generate, paths, chunksize=16):
+        written+=len(done)
+    click.echo('{} derivatives written for {} uploads'.format(written, len(paths)))
@@ -0,0 +1,205 @@
+"""
+Off request image ingestion.
+
+Photo.create only sniffs the image header, streams the upload into a spool
+file and writes the Photo row with no filePath. The rest of the work is
+handed to a small thread pool: the spooled file is validated, moved to its
+content address in UPLOAD_DIR (see storage) and the row is given its
+filePath. Until then the photo shows up in feeds as processing. Uploads
+that fail validation have their row removed.
+
+Spool files are named after the process that spooled them and the photoID
+they belong to, so anything left behind by a worker that died mid job can
+be picked back up by recover() in the worker gunicorn forks to replace it.
+"""
+
+import imghdr
+import logging
+import os
+import shutil
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import pymysql.err
+
+from .. import cache
+from .. import metrics
+from ..app import app
+from . import derivatives
+from . import storage
+from ..database import raw
+
+logger=logging.getLogger(__name__)
+
+CHUNK_SIZE=0x10000
+
+_pool=None
+_pool_pid=None
+
+
+def spool_dir():
+    return app.config['SPOOL_DIR']
+
+
+def pool():
+    """
+    The ingest worker pool for this process. Made lazily,
+    and again after a fork, since threads do not survive one.
+    """
+    global _pool, _pool_pid
+    if _pool is None or _pool_pid != os.getpid():
+        _pool=ThreadPoolExecutor(
+            max_workers=app.config['INGEST_WORKERS'],
+            thread_name_prefix='ingest'
+        )
+        _pool_pid=os.getpid()
+    return _pool
+
+
+def sniff(file_storage):
+    """
+    Image type from the first few bytes of an upload, leaving the
+    stream where it was.
+
+    :return: 'png', 'jpeg', 'gif', ... or None
+    """
+    stream=file_storage.stream
+    position=stream.tell()
+    header=stream.read(32)
+    stream.seek(position)
+    return imghdr.what('', header)
+
+
+def spool(file_storage):
+    """
+    Streams an upload into a temporary spool file in chunks.
+
+    :return str: path of the spool file
+    """
+    path=os.path.join(spool_dir(), 'tmp-{}-{}'.format(os.getpid(), uuid.uuid4().hex))
+    with open(path, 'wb') as f:
+        shutil.copyfileobj(file_storage.stream, f, CHUNK_SIZE)
+        metrics.uploaded(f.tell())
+    return path
+
+
+def _job_path(photo_id, ext):
+    return os.path.join(spool_dir(), '{}-{}.{}'.format(os.getpid(), photo_id, ext))
+
+
+def submit(photo_id, path, ext):
+    """
+    Hands a spooled upload for photo_id to the ingest pool.
+    """
+    spooled=_job_path(photo_id, ext)
+    os.replace(path, spooled)
+    return pool().submit(_run, photo_id, spooled, ext)
+
+
+def _run(photo_id, spooled, ext):
+    try:
+        finalize(photo_id, spooled, ext)
+    except Exception:
+        logger.exception('ingest of photo {} failed'.format(photo_id))
+
+
+def finalize(photo_id, spooled, ext):
+    """
+    Validates a spooled upload, stores it by content and
+    gives its Photo row a filePath. Invalid uploads lose their row.
+    """
+    rows=raw.fetch_all(
+        'SELECT photoID FROM Photo WHERE photoID = %s',
+        (photo_id,)
+    )
+    if len(rows) == 0:
+        # deleted before we got to it
+        os.remove(spooled)
+        return
+
+    if os.path.getsize(spooled) == 0 or imghdr.what(spooled) != ext:
+        with raw.transaction() as tx:
+            tx.execute('DELETE FROM Photo WHERE photoID = %s', (photo_id,))
+        os.remove(spooled)
+        return
+
+    # hashed outside the lock, it is held by every ingest and delete
+    target=storage.content_path(storage.digest(spooled), ext)
+    try:
+        with storage.locked():
+            filepath, created=storage.store(spooled, target)
+            with raw.transaction() as tx:
+                tx.execute(
+                    'UPDATE Photo SET filePath = %s WHERE photoID = %s',
+                    (filepath, photo_id)
+                )
+    except pymysql.err.MySQLError:
+        storage.release(target)
+        raise
+    cache.fragments.bump('photo', photo_id)
+
+    if created:
+        future=derivatives.submit(filepath)
+        if future is not None:
+            # the tile's srcset lists the derivatives that exist
+            future.add_done_callback(lambda _: cache.fragments.bump('photo', photo_id))
+
+
+def _owner(name):
+    """
+    pid of the process a spool file belongs to, None for files
+    named before spool names carried one.
+    """
+    parts=name.split('-')
+    if parts[0] == 'tmp':
+        parts=parts[1:]
+    if len(parts) < 2 or not parts[0].isdigit():
+        return None
+    return int(parts[0])
+
+
+def _alive(pid):
+    if pid is None:
+        return False
+    if pid in (os.getpid(), os.getppid()):
+        # recover runs before this worker spools anything, and the
+        # gunicorn master never does, so these are from an earlier
+        # process that had the same pid
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def recover():
+    """
+    Hands spool files left behind by a process that went away with
+    jobs still queued to the ingest pool. Runs in every worker as it
+    starts, so the workers of a new run finish the last run's uploads
+    and the worker replacing one that died picks up its jobs. Files of
+    live processes are left alone, and a file is claimed by renaming it
+    before it is queued, so two workers never take the same one.
+    """
+    for name in os.listdir(spool_dir()):
+        path=os.path.join(spool_dir(), name)
+        if _alive(_owner(name)):
+            continue
+        if name.startswith('tmp-'):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            continue
+
+        photo_id, ext=name.split('-')[-1].split('.', 1)
+        claimed=_job_path(photo_id, ext)
+        try:
+            os.rename(path, claimed)
+        except FileNotFoundError:
+            # another worker got to it first
+            continue
+        pool().submit(_run, int(photo_id), claimed, ext)
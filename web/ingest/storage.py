@@ -0,0 +1,163 @@
+"""
+Content addressed upload storage.
+
+Uploads are stored by the sha256 of their bytes, sharded two levels deep so
+no single directory gets too big:
+
+    UPLOAD_DIR/ab/cd/abcd....<ext>
+
+The same image uploaded twice is stored once, and every Photo row for it
+points at the same filePath. Files are only removed once no Photo row
+references them any more.
+
+Storing a file and pointing a row at it, and counting references and
+unlinking, both happen under locked(), otherwise a release could unlink a
+file between store() finding it and the new row referencing it.
+"""
+
+import contextlib
+import fcntl
+import hashlib
+import os
+import shutil
+
+import click
+
+from . import derivatives
+from ..app import app
+from ..database import raw
+
+CHUNK_SIZE=0x10000
+
+
+def digest(path):
+    """
+    sha256 hexdigest of the file at path, read in chunks.
+    """
+    sha256=hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+def content_path(sha256, ext):
+    return os.path.join(
+        app.config['UPLOAD_DIR'],
+        sha256[:2],
+        sha256[2:4],
+        '{}.{}'.format(sha256, ext)
+    )
+
+
+@contextlib.contextmanager
+def locked():
+    """
+    Held across threads and worker processes. Uploads are on local
+    disk, so a file lock is enough.
+    """
+    with open(app.config['STORAGE_LOCK'], 'a') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def store(path, target):
+    """
+    Moves the file at path to its content address target, see
+    content_path. If the same content is already stored the file
+    at path is just removed. Call with locked() held, until the
+    row pointing at target is committed.
+
+    :return: (stored path, True if it was not stored before)
+    """
+    if os.path.exists(target):
+        os.remove(path)
+        return target, False
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    shutil.move(path, target)
+    return target, True
+
+
+def link_path(path):
+    """
+    Path of a stored file relative to UPLOAD_DIR, as served by /img.
+    """
+    root=app.config['UPLOAD_DIR']
+    if os.path.commonpath((root, path)) == root:
+        return os.path.relpath(path, root)
+    # stored before UPLOAD_DIR moved, fall back to the last directory
+    dir_name, name=os.path.split(path)
+    return os.path.join(os.path.basename(dir_name), name)
+
+
+def references(path):
+    rows=raw.fetch_all(
+        'SELECT COUNT(*) AS refs FROM Photo WHERE filePath = %s',
+        (path,)
+    )
+    return rows[0]['refs']
+
+
+def unlink(path):
+    for width in app.config['DERIVATIVE_WIDTHS']:
+        for fmt in (None, app.config['DERIVATIVE_FORMAT']):
+            candidate=derivatives.derivative_path(path, width, fmt)
+            if os.path.exists(candidate):
+                os.remove(candidate)
+    if os.path.exists(path):
+        os.remove(path)
+
+
+def release(path):
+    """
+    Called once a Photo row pointing at path is gone. Removes the
+    file and its derivatives when nothing references it any more.
+    """
+    if path is None:
+        return
+    with locked():
+        if references(path) == 0:
+            unlink(path)
+
+
+@app.cli.command('dedup-uploads')
+def dedup_command():
+    """
+    Moves uploads stored before content addressing to their
+    content address, merging duplicates.
+    """
+    rows=raw.fetch_all(
+        'SELECT DISTINCT filePath FROM Photo WHERE filePath IS NOT NULL'
+    )
+    moved=merged=missing=0
+    for row in rows:
+        old=row['filePath']
+        if not os.path.exists(old):
+            missing+=1
+            continue
+        ext=os.path.splitext(old)[1][1:]
+        new=content_path(digest(old), ext)
+        if new == old:
+            continue
+
+        if os.path.exists(new):
+            merged+=1
+        else:
+            os.makedirs(os.path.dirname(new), exist_ok=True)
+            shutil.copy2(old, new)
+            moved+=1
+
+        with raw.transaction() as tx:
+            tx.execute(
+                'UPDATE Photo SET filePath = %s WHERE filePath = %s',
+                (new, old)
+            )
+        unlink(old)
+        derivatives.submit(new)
+
+    click.echo('{} moved, {} merged into an existing copy, {} missing on disk'.format(
+        moved, merged, missing
+    ))
@@ -0,0 +1,4 @@
+from .metrics import store, request_started, request_finished, uploaded, \
+    image_served, cache_lookup, render
+from .store import Store
+from .routes import pages
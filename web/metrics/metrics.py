@@ -0,0 +1,197 @@
+"""
+What gets measured, and how it is written out for prometheus.
+
+Request latency, status and DB time are recorded per route from the
+before / after request hooks. Upload bytes, image bytes and cache lookups
+are counted by the code doing them, through the helpers below, and raw
+transactions report their statement count when they commit.
+"""
+
+import time
+
+from flask import g, request
+
+from .store import Store
+from ..app import app
+from ..database import raw
+
+PREFIX='ts_'
+
+# seconds
+LATENCY_BUCKETS=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# seconds spent in the database per request
+DB_TIME_BUCKETS=(0.001, 0.002, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+
+# statements per request, and per committed raw transaction
+STATEMENT_BUCKETS=(1, 2, 5, 10, 20, 50, 100, 200)
+
+# held open on purpose, their duration would swamp the histograms
+UNTIMED_ENDPOINTS={'events.stream'}
+
+store=Store()
+store.configure(
+    app.config['METRICS_DIR'],
+    interval=app.config['METRICS_FLUSH_SECONDS'],
+)
+
+
+def _route():
+    if request.url_rule is None:
+        return 'unmatched'
+    return request.url_rule.rule
+
+
+def request_started():
+    """
+    before_request hook.
+    """
+    g.metrics_started=time.perf_counter()
+
+
+def request_finished(response):
+    """
+    after_request hook.
+    """
+    started=g.get('metrics_started', None)
+    if started is None:
+        return response
+    seconds=time.perf_counter() - started
+    route=_route()
+    blueprint=request.blueprint or 'app'
+
+    store.inc('http_requests_total', (
+        ('blueprint', blueprint),
+        ('route', route),
+        ('method', request.method),
+        ('status', str(response.status_code)),
+    ))
+    if request.endpoint in UNTIMED_ENDPOINTS:
+        return response
+    store.observe(
+        'http_request_duration_seconds',
+        LATENCY_BUCKETS,
+        seconds,
+        (('blueprint', blueprint), ('route', route)),
+    )
+
+    # totals kept by database.instrument
+    sql_stats=g.get('sql_stats', None)
+    if sql_stats is not None:
+        store.observe(
+            'db_time_seconds',
+            DB_TIME_BUCKETS,
+            sql_stats.seconds,
+            (('blueprint', blueprint), ('route', route)),
+        )
+        store.observe(
+            'db_statements',
+            STATEMENT_BUCKETS,
+            sql_stats.count,
+            (('blueprint', blueprint), ('route', route)),
+        )
+    return response
+
+
+def uploaded(nbytes):
+    store.inc('upload_bytes_total', value=nbytes)
+
+
+def image_served(nbytes, offloaded=False):
+    store.inc(
+        'image_bytes_total',
+        (('offloaded', 'true' if offloaded else 'false'),),
+        nbytes
+    )
+
+
+def cache_lookup(tier, hit):
+    store.inc('cache_requests_total', (
+        ('tier', tier),
+        ('result', 'hit' if hit else 'miss'),
+    ))
+
+
+def transaction_committed(statements):
+    store.observe('db_transaction_statements', STATEMENT_BUCKETS, statements)
+
+
+raw.commit_listeners.append(transaction_committed)
+
+
+def _labels(labels, extra=()):
+    labels=tuple(labels) + tuple(extra)
+    if not labels:
+        return ''
+    return '{' + ','.join(
+        '{}="{}"'.format(name, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+        for name, value in labels
+    ) + '}'
+
+
+def _bound(bound):
+    return '+Inf' if bound == float('inf') else repr(float(bound))
+
+
+def render():
+    """
+    Everything in the prometheus text exposition format.
+
+    :return str:
+    """
+    counters, histograms=store.collect()
+    lines=[]
+
+    for name in sorted({name for name, _ in counters}):
+        lines.append('# TYPE {}{} counter'.format(PREFIX, name))
+        for (metric, labels), value in sorted(counters.items()):
+            if metric == name:
+                lines.append('{}{}{} {}'.format(PREFIX, name, _labels(labels), value))
+
+    for name in sorted({name for name, _ in histograms}):
+        lines.append('# TYPE {}{} histogram'.format(PREFIX, name))
+        for (metric, labels), histogram in sorted(histograms.items()):
+            if metric != name:
+                continue
+            total=0
+            bounds=histogram['buckets'] + [float('inf')]
+            for bound, count in zip(bounds, histogram['counts']):
+                total+=count
+                lines.append('{}{}_bucket{} {}'.format(
+                    PREFIX, name, _labels(labels, (('le', _bound(bound)),)), total
+                ))
+            lines.append('{}{}_sum{} {}'.format(PREFIX, name, _labels(labels), histogram['sum']))
+            lines.append('{}{}_count{} {}'.format(PREFIX, name, _labels(labels), histogram['count']))
+
+    # share of request time spent waiting on the database, per route
+    lines.append('# TYPE {}db_time_share gauge'.format(PREFIX))
+    for (name, labels), histogram in sorted(histograms.items()):
+        if name == 'http_request_duration_seconds' and histogram['sum'] > 0:
+            db_time=histograms.get(('db_time_seconds', labels))
+            lines.append('{}db_time_share{} {}'.format(
+                PREFIX, _labels(labels), db_time['sum'] / histogram['sum'] if db_time else 0
+            ))
+
+    lines.append('# TYPE {}db_statements_per_commit gauge'.format(PREFIX))
+    for (name, labels), histogram in sorted(histograms.items()):
+        if name == 'db_transaction_statements' and histogram['count'] > 0:
+            lines.append('{}db_statements_per_commit{} {}'.format(
+                PREFIX, _labels(labels), histogram['sum'] / histogram['count']
+            ))
+
+    lines.append('# TYPE {}cache_hit_ratio gauge'.format(PREFIX))
+    lookups={}
+    for (name, labels), value in counters.items():
+        if name == 'cache_requests_total':
+            labels=dict(labels)
+            hits, total=lookups.get(labels['tier'], (0, 0))
+            lookups[labels['tier']]=(
+                hits + (value if labels['result'] == 'hit' else 0),
+                total + value
+            )
+    for tier, (hits, total) in sorted(lookups.items()):
+        lines.append('{}cache_hit_ratio{} {}'.format(
+            PREFIX, _labels((('tier', tier),)), hits / total if total else 0
+        ))
+
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,23 @@
+import hmac
+
+from flask import Blueprint, Response, abort, request
+
+from . import metrics
+from ..app import app
+
+pages=Blueprint('metrics', __name__)
+
+
+@pages.route('/metrics')
+def scrape():
+    token=app.config['METRICS_TOKEN']
+    # closed unless a token is configured
+    if not token or not hmac.compare_digest(
+            request.headers.get('Authorization', ''),
+            'Bearer ' + token
+    ):
+        abort(403)
+    return Response(
+        metrics.render(),
+        mimetype='text/plain; version=0.0.4'
+    )
@@ -0,0 +1,157 @@
+"""
+Multi process metric storage.
+
+gunicorn forks several workers and /metrics is answered by whichever one
+gets the scrape, so every process keeps its own counters and histograms in
+memory and writes them to METRICS_DIR/<pid>.json every few seconds. Reading
+merges every file in the directory. Each file has a single writer and is
+replaced atomically, so no locking between processes is needed.
+
+Files from workers that have exited are kept, so counters never go
+backwards. gunicorn_config.when_ready clears the directory at startup.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+
+logger=logging.getLogger(__name__)
+
+
+class Store:
+    def __init__(self):
+        self.directory=None
+        self.interval=5
+        self.lock=threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self.counters={}
+        self.histograms={}
+        self.pid=os.getpid()
+        self.flusher=None
+
+    def configure(self, directory, interval=5):
+        self.directory=directory
+        self.interval=interval
+
+    def _ensure_process(self):
+        # a forked worker starts from an empty store and a flusher of
+        # its own, threads do not survive the fork
+        if self.pid != os.getpid():
+            self._reset()
+        if self.flusher is None and self.directory is not None:
+            self.flusher=threading.Thread(
+                target=self._flush_forever,
+                name='metrics-flusher',
+                daemon=True
+            )
+            self.flusher.start()
+
+    def inc(self, name, labels=(), value=1):
+        with self.lock:
+            self._ensure_process()
+            key=(name, tuple(labels))
+            self.counters[key]=self.counters.get(key, 0) + value
+
+    def observe(self, name, buckets, value, labels=()):
+        """
+        :param buckets: sorted upper bounds, +Inf is implied
+        """
+        with self.lock:
+            self._ensure_process()
+            key=(name, tuple(labels))
+            histogram=self.histograms.get(key)
+            if histogram is None:
+                histogram=self.histograms[key]={
+                    'buckets': list(buckets),
+                    'counts' : [0] * (len(buckets) + 1),
+                    'sum'    : 0.0,
+                    'count'  : 0,
+                }
+            at=len(buckets)
+            for i, bound in enumerate(buckets):
+                if value <= bound:
+                    at=i
+                    break
+            histogram['counts'][at]+=1
+            histogram['sum']+=value
+            histogram['count']+=1
+
+    def flush(self):
+        """
+        Writes this process's numbers to its file.
+        """
+        if self.directory is None:
+            return
+        with self.lock:
+            self._ensure_process()
+            snapshot={
+                'counters'  : [
+                    [name, labels, value]
+                    for (name, labels), value in self.counters.items()
+                ],
+                'histograms': [
+                    [name, labels, dict(histogram, counts=list(histogram['counts']))]
+                    for (name, labels), histogram in self.histograms.items()
+                ],
+            }
+        path=os.path.join(self.directory, '{}.json'.format(os.getpid()))
+        tmp=path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(snapshot, f)
+        os.replace(tmp, path)
+
+    def _flush_forever(self):
+        pid=os.getpid()
+        while self.pid == pid:
+            time.sleep(self.interval)
+            try:
+                self.flush()
+            except OSError as e:
+                logger.warning('unable to write metrics: {}'.format(e))
+
+    def collect(self):
+        """
+        Every process's numbers summed.
+
+        :return: (counters, histograms) keyed by (name, labels)
+        """
+        counters={}
+        histograms={}
+        if self.directory is None:
+            return counters, histograms
+        self.flush()
+        for filename in os.listdir(self.directory):
+            if not filename.endswith('.json'):
+                continue
+            try:
+                with open(os.path.join(self.directory, filename)) as f:
+                    snapshot=json.load(f)
+            except (OSError, ValueError):
+                continue
+            for name, labels, value in snapshot['counters']:
+                key=(name, tuple(tuple(label) for label in labels))
+                counters[key]=counters.get(key, 0) + value
+            for name, labels, histogram in snapshot['histograms']:
+                key=(name, tuple(tuple(label) for label in labels))
+                merged=histograms.get(key)
+                if merged is None:
+                    histograms[key]=histogram
+                    continue
+                merged['counts']=[a + b for a, b in zip(merged['counts'], histogram['counts'])]
+                merged['sum']+=histogram['sum']
+                merged['count']+=histogram['count']
+        return counters, histograms
+
+    def clear(self):
+        """
+        Removes every process's file, for a fresh start.
+        """
+        if self.directory is None:
+            return
+        for filename in os.listdir(self.directory):
+            if filename.endswith('.json') or filename.endswith('.tmp'):
+                os.remove(os.path.join(self.directory, filename))
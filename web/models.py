@@ -1,30 +1,35 @@
-import hashlib
-import imghdr
 import os
-import time
 
+import pymysql.err
 from flask import flash
 from flask_login import current_user
 from werkzeug.security import generate_password_hash, check_password_hash
 
 import bigsql
+from . import cache
+from . import events
+from . import feed
 from . import home
+from . import ingest
 from . import notifications
+from . import search
 from . import users
 from .app import app, db
+from .database import identity, raw
+from .graph import graph, PENDING, NOT_FOLLOWING
 
 
 class Share(bigsql.DynamicModel):
     @property
     def photo(self):
-        return Photo.query.find(
+        return db.query('Photo').find(
             photoID=self.photoID
         ).first()
 
 class Tag(bigsql.DynamicModel):
     @property
     def photo(self):
-        p=Photo.query.find(
+        p=db.query('Photo').find(
             photoID=self.photoID
         ).first()
         return p
@@ -43,111 +48,167 @@ class Follow(bigsql.DynamicModel):
 
 
 class Photo(bigsql.DynamicModel):
-    @property
-    def image_link(self):
+    def image_link(self, size=None, fmt=None):
+        """
+        Link to the image, or to the smallest derivative at least size
+        pixels wide when one exists. Falls back to the original.
+
+        :param int size: width the image will be drawn at
+        :param str fmt: format of the derivative, ie 'webp'
+        :return str:
+        """
+        if self.filePath is None:
+            return ''
+        path=self.filePath
+        if size is not None:
+            for width in sorted(app.config['DERIVATIVE_WIDTHS']):
+                candidate=ingest.derivatives.derivative_path(self.filePath, width, fmt)
+                if width >= size and os.path.exists(candidate):
+                    path=candidate
+                    break
+        return '/img/{}'.format(ingest.storage.link_path(path))
+
+    def image_srcset(self, fmt=None):
+        """
+        srcset attribute value listing every derivative that exists.
+        """
         if self.filePath is None:
             return ''
-        dir_name, image_name=os.path.split(self.filePath)
-        _, dir_name=os.path.split(dir_name)
-        return '/img/{}/{}'.format(dir_name, image_name)
+        srcset=[]
+        for width in sorted(app.config['DERIVATIVE_WIDTHS']):
+            if os.path.exists(ingest.derivatives.derivative_path(self.filePath, width, fmt)):
+                srcset.append('{} {}w'.format(self.image_link(width, fmt), width))
+        return ', '.join(srcset)
 
     @staticmethod
     def create(form):
         """
-        :param image:
-        :param owner:
-        :param caption:
-        :param all_followers:
-        :return: new photo object
+        Writes the Photo row for an upload and queues the image itself
+        for the ingest pool. The photo is shown as processing until
+        the pool has stored it.
+
+        :param form: PostForm
+        :return: True, False or 'invalid'
         """
 
         try:
-            ext=imghdr.what(
-                '',
-                form.image.raw_data[0].stream._file.getbuffer().tobytes()
-            )
-        except TypeError:
+            ext=ingest.sniff(form.image.data)
+        except (TypeError, AttributeError):
             return False
 
         if ext not in ('png', 'jpeg', 'gif'):
             # handle invalid file
             return 'invalid'
 
-        sha256=lambda s: hashlib.sha256(s.encode()).hexdigest()
-
-        filename='{}.{}'.format(sha256('{}{}{}{}'.format(
-            str(time.time()),
-            form.caption.data,
-            current_user.username,
-            os.urandom(0x10)
-        )), ext)
-
-        filedir=os.path.join(
-            app.config['UPLOAD_DIR'],
-            sha256(current_user.username),
-        )
-
-        filepath=os.path.join(
-            filedir,
-            filename
-        )
-
-        os.makedirs(filedir, exist_ok=True)
-
-        form.image.data.save(filepath)
-
         caption=form.caption.data.split()
 
         tags, caption=Photo.parse_caption(caption)
-        photo=db.query('Photo').new(
-            allFollowers=form.public.data,
-            photoOwner=current_user.username,
-            filePath=filepath,
-            caption=caption,
-        )
-
-        for tag in tags:
-            db.query('Tag').new(
-                username=tag,
-                photoID=photo.photoID,
-                acceptedTag=False
-            )
 
+        group=None
         if form.group.data:
             group=db.query('CloseFriendGroup').find(
                 groupName=form.group.data
             ).first()
 
-            if group.groupOwner != current_user.username and (group is None or not any(
-                    group.groupName == g.groupName
-                    for g in current_user.belongs
-            )):
-                flash('Unable to post to {}'.format(group.groupName))
-
-            db.query('Share').new(
-                groupName=group.groupName,
-                groupOwner=group.groupOwner,
-                photoID=photo.photoID
-            )
+            # read straight from Belong, a cached membership can outlive
+            # its removal in other workers
+            if group is None or group.groupOwner != current_user.username and db.query('Belong').find(
+                    groupName=group.groupName,
+                    groupOwner=group.groupOwner,
+                    username=current_user.username
+            ).first() is None:
+                flash('Unable to post to {}'.format(form.group.data))
+                return False
+
+        spooled=ingest.spool(form.image.data)
+
+        # the photo, its tags, its share and its timeline rows go in as
+        # one transaction. Tags and the share are buffered on it and sent
+        # as one multi row INSERT per table.
         try:
-            db.session.commit()
-            return True
-        except bigsql.big_ERROR:
-            db.session.rollback()
+            with raw.transaction() as tx:
+                # filePath stays NULL until the ingest pool has stored the image
+                tx.execute(
+                    'INSERT INTO Photo (allFollowers, photoOwner, caption) '
+                    'VALUES (%s, %s, %s)',
+                    (form.public.data, current_user.username, caption)
+                )
+                photo_id=tx.lastrowid
+
+                for tag in tags:
+                    tx.add('Tag', username=tag, photoID=photo_id, acceptedTag=False)
+
+                if group is not None:
+                    tx.add(
+                        'Share',
+                        groupName=group.groupName,
+                        groupOwner=group.groupOwner,
+                        photoID=photo_id
+                    )
+
+                # flushes the tags and share first, it reads Share
+                feed.timeline.fan_out(
+                    tx,
+                    photo_id,
+                    current_user.username,
+                    form.public.data
+                )
+        except pymysql.err.MySQLError:
+            os.remove(spooled)
             return False
 
+        for tag in tags:
+            notifications.inbox.changed(tag, 1)
+            events.notification(tag, 'tag', current_user.username)
+
+        members=()
+        if group is not None:
+            members=[group.groupOwner] + [
+                row['username']
+                for row in raw.fetch_all(
+                    'SELECT username FROM Belong WHERE groupName = %s AND groupOwner = %s',
+                    (group.groupName, group.groupOwner)
+                )
+            ]
+        events.new_post(current_user.username, form.public.data, members)
+
+        ingest.submit(photo_id, spooled, ext)
+        return True
+
     @staticmethod
     def parse_caption(caption):
-        tags=[]
-        rem=set()
-        for index, word in enumerate(caption):
-            if word.startswith('@'):
-                username=word[1:]
-                if Person.query.find(
-                        username=username
-                ).first() is not None:
-                    rem.add(index)
-                    tags.append(username)
+        """
+        Picks the @mentions out of a caption. Mentions are deduplicated,
+        capped at MAX_CAPTION_MENTIONS and resolved against Person with
+        a single IN (...) lookup.
+
+        :param caption: caption split into words
+        :return: ([ username ], caption string)
+        """
+        mentions={}
+        for word in caption:
+            if word.startswith('@') and len(word) > 1:
+                mentions.setdefault(word[1:].lower(), word[1:])
+        mentions=list(mentions.values())[:app.config['MAX_CAPTION_MENTIONS']]
+
+        if len(mentions) == 0:
+            return [], ' '.join(caption)
+
+        # usernames compare case insensitively in the database
+        found={
+            row['username'].lower(): row['username']
+            for row in raw.fetch_all(
+                'SELECT username FROM Person WHERE username IN ({})'.format(
+                    raw.placeholders(mentions)
+                ),
+                tuple(mentions)
+            )
+        }
+        tags=[
+            found[username.lower()]
+            for username in mentions
+            if username.lower() in found
+        ]
         return tags, ' '.join(caption)
 
     @staticmethod
@@ -168,35 +229,27 @@ class Photo(bigsql.DynamicModel):
     @staticmethod
     def visible_to(username):
         """
-        Should give back all photo object that are visible to username
-
-        TODO:
-        need to make this order all photos by timestamp
+        Gives back all photo objects that are visible to username,
+        newest first. See feed.visible_photos for the query.
 
         :return: [ Photo ]
         """
-        u=db.query('Person').find(
-            username=username
-        ).first()
+        return feed.visible_photos(username)
 
-        photos=[]
-        photos.extend(u.photos)
-        photos.extend(CloseFriendGroup.find_shared_photos(u))
-
-        for f in filter(lambda x: x.acceptedfollow, u.follow):
-            p=Person.query.find(
-                username=f.followeeUsername
-            ).first()
-            photos.extend(filter(
-                lambda x: x.allFollowers,
-                p.photos
-            ))
+    @property
+    def state(self):
+        """
+        Likes, comments and tags for this photo, preloaded
+        in bulk by feed.hydrate when drawn as part of a page.
+        """
+        return feed.state_of(self)
 
-        return set(sorted(
-            photos,
-            key=lambda x: x.timestamp,
-            reverse=True
-        ))
+    @property
+    def tile_variant(self):
+        """
+        Fragment cache variant of this photo's tile for the current user.
+        """
+        return feed.tile_variant(self, feed.state_of(self, complete=False).liked)
 
     @property
     def delete_form(self):
@@ -229,8 +282,8 @@ class CloseFriendGroup(bigsql.DynamicModel):
         :return: [PhotoModel]
         """
 
-        for b in person.belongs:
-            shares=CloseFriendGroup.query.find(
+        for b in person.memberships:
+            shares=db.query('CloseFriendGroup').find(
                 groupName=b.groupName,
                 groupOwner=b.groupOwner
             ).first().shares
@@ -269,13 +322,17 @@ class Person(bigsql.DynamicModel):
         return Photo.visible_to(self.username)
 
     def follows(self, user):
-        return db.sql.SELECTFROM(
-            'Follow'
-        ).WHERE(
-            followerUsername=self.username
-        ).AND(
-            followeeUsername=user.username
-        ).first() is not None or user.username == self.username
+        """
+        True if there is a follow from self to user, accepted or not.
+        """
+        return user.username == self.username or \
+               graph.state(self.username, user.username) != NOT_FOLLOWING
+
+    def follow_state(self, user):
+        """
+        :return: graph.FOLLOWING, graph.PENDING or graph.NOT_FOLLOWING
+        """
+        return graph.state(self.username, user.username)
 
     @staticmethod
     def create(username, password):
@@ -294,20 +351,46 @@ class Person(bigsql.DynamicModel):
         db.session.add(u)
         try:
             db.session.commit()
+            search.index.added(username)
         except bigsql.big_ERROR:
             db.session.rollback()
         return u
 
     def awaiting_accept(self, other):
-        return db.query('Follow').find(
-            followeeUsername=other.username,
-            followerUsername=self.username,
-            acceptedfollow=False
-        ).first() is not None
+        return graph.state(self.username, other.username) == PENDING
 
     @staticmethod
     def get(username):
-        return Person.query.find(username=username).first()
+        """
+        Not cached across requests: models are mutable, and one built
+        with new() is inserted. The identity map answers repeat lookups
+        within a request.
+
+        :return: PersonModel or None
+        """
+        return db.query('Person').find(username=username).first()
+
+    @property
+    def memberships(self):
+        """
+        (groupName, groupOwner, username) for the groups this person
+        is in. Shared between workers through the cache tier when it
+        spans them, so an invalidation reaches all of them.
+        """
+        def load():
+            return [
+                cache.Membership(b.groupName, b.groupOwner, b.username)
+                for b in self.belongs
+            ]
+
+        return identity.remember(
+            'Belong',
+            ('username', self.username),
+            lambda: cache.memoize(
+                cache.memberships_key(self.username),
+                load
+            ) if cache.spans_workers() else load()
+        )
 
     @property
     def follow_form(self):
@@ -315,10 +398,14 @@ class Person(bigsql.DynamicModel):
 
     @property
     def notifications(self):
-        return db.query('Tag').find(
-            username=self.username,
-            acceptedTag=False,
-        ).all() + db.query('Follow').find(
-            followeeUsername=self.username,
-            acceptedfollow=False,
-        ).all()
+        """
+        The first few pending notifications, for the sidebar.
+        """
+        return notifications.inbox.fetch(
+            self.username,
+            limit=app.config['NOTIFICATION_SIDEBAR_SIZE']
+        )[0]
+
+    @property
+    def unread_notifications(self):
+        return notifications.inbox.unread_count(self.username)
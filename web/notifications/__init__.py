@@ -1,2 +1,4 @@
+from . import inbox
 from .notifications import enable_notifications
-from .forms import TagForm, FollowForm
\ No newline at end of file
+from .forms import TagForm, FollowForm
+from .routes import pages
@@ -0,0 +1,155 @@
+"""
+Pending notifications for a user: tags waiting to be accepted and follow
+requests waiting to be accepted.
+
+Both kinds are selected by one UNION ALL, ordered and limited in the
+database, so the sidebar never loads more than it draws. The badge count
+is cached per user in the shared tier and adjusted in place by the
+handlers that create, accept or reject a notification. A count that is
+not cached is reloaded with a single COUNT query.
+"""
+
+from .forms import FollowForm, TagForm
+from .. import cache
+from ..app import app
+from ..database import raw
+
+FOLLOW='follow'
+TAG='tag'
+
+PENDING='''
+SELECT *
+FROM (
+    SELECT 'follow' AS kind,
+           Follow.followerUsername AS sender,
+           0 AS photoID
+    FROM Follow
+    WHERE Follow.followeeUsername = %s
+      AND Follow.acceptedfollow = FALSE
+    UNION ALL
+    SELECT 'tag' AS kind,
+           Photo.photoOwner AS sender,
+           Tag.photoID AS photoID
+    FROM Tag
+    JOIN Photo
+      ON Photo.photoID = Tag.photoID
+    WHERE Tag.username = %s
+      AND Tag.acceptedTag = FALSE
+) AS Pending
+'''
+
+AFTER_CLAUSE='''
+WHERE (kind, sender, photoID) > (%s, %s, %s)
+'''
+
+ORDER_CLAUSE='''
+ORDER BY kind, sender, photoID
+LIMIT %s
+'''
+
+COUNT='''
+SELECT (
+    SELECT COUNT(*) FROM Follow
+    WHERE followeeUsername = %s AND acceptedfollow = FALSE
+) + (
+    SELECT COUNT(*) FROM Tag
+    WHERE username = %s AND acceptedTag = FALSE
+) AS unread
+'''
+
+
+class Notification:
+    """
+    One pending tag or follow request, as drawn by notifications.html.
+    """
+
+    def __init__(self, username, kind, sender, photo_id):
+        self.username=username
+        self.kind=kind
+        self.sender=sender
+        self.photo_id=photo_id or None
+
+    def to_form(self):
+        if self.kind == FOLLOW:
+            form=FollowForm()
+            form.id.data=self.sender
+        else:
+            form=TagForm()
+            form.id.data=self.username
+        return form
+
+    @property
+    def cursor(self):
+        return '{}_{}_{}'.format(self.kind, self.photo_id or 0, self.sender)
+
+
+def decode_cursor(cursor):
+    """
+    Inverse of Notification.cursor, None for missing or mangled cursors.
+
+    :return: (kind, sender, photoID) or None
+    """
+    if not cursor:
+        return None
+    try:
+        kind, photo_id, sender=cursor.split('_', 2)
+        return kind, sender, int(photo_id)
+    except ValueError:
+        return None
+
+
+def fetch(username, cursor=None, limit=None):
+    """
+    A page of username's pending notifications, follow requests first.
+
+    :param str username:
+    :param str cursor: next cursor from a previous page
+    :param int limit: defaults to NOTIFICATION_PAGE_SIZE
+    :return: ([ Notification ], next cursor or None)
+    """
+    limit=limit or app.config['NOTIFICATION_PAGE_SIZE']
+    sql=PENDING
+    args=[username, username]
+
+    after=decode_cursor(cursor)
+    if after is not None:
+        sql+=AFTER_CLAUSE
+        args.extend(after)
+
+    sql+=ORDER_CLAUSE
+    args.append(limit + 1)
+
+    notifications=[
+        Notification(username, row['kind'], row['sender'], row['photoID'])
+        for row in raw.fetch_all(sql, tuple(args))
+    ]
+    if len(notifications) > limit:
+        notifications=notifications[:limit]
+        return notifications, notifications[-1].cursor
+    return notifications, None
+
+
+def unread_count(username):
+    """
+    Number of pending notifications for username, from the cache when
+    it is there.
+
+    :return int:
+    """
+    shared=cache.backend()
+    count=shared.get_count(cache.unread_key(username))
+    if count is None:
+        count=int(raw.fetch_all(COUNT, (username, username))[0]['unread'])
+        shared.set_count(cache.unread_key(username), count)
+    return count
+
+
+def changed(username, delta):
+    """
+    Adjusts the cached count for username. Call after the write that
+    created (+1) or resolved (-1) a notification has committed.
+    """
+    count=cache.backend().incr(cache.unread_key(username), delta)
+    if count is not None and count < 0:
+        # drifted, let the next read count again
+        cache.backend().delete(cache.unread_key(username))
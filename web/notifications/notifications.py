@@ -4,8 +4,12 @@ from flask import request
 from flask_login import current_user
 
 from bigsql import bigsql
+from . import inbox
 from .forms import FollowForm, TagForm
+from .. import cache
+from .. import feed
 from ..app import db
+from ..graph import graph
 
 
 def validate(func):
@@ -39,6 +43,12 @@ def handle_follow(form):
 
     try:
         db.session.commit()
+        inbox.changed(current_user.username, -1)
+        if form.action.data == "accept":
+            graph.accepted_follow(form.id.data, current_user.username)
+            feed.timeline.follow_accepted(form.id.data, current_user.username)
+        elif form.action.data == "reject":
+            graph.removed(form.id.data, current_user.username)
     except bigsql.big_ERROR:
         db.session.rollback()
 
@@ -53,6 +63,8 @@ def handle_tag(form):
     if t is None:
         return
 
+    username=t.username
+    photo_id=t.photoID
     if form.action.data == "accept":
         t.acceptedTag=True
     elif form.action.data == "reject":
@@ -60,6 +72,8 @@ def handle_tag(form):
 
     try:
         db.session.commit()
+        inbox.changed(username, -1)
+        cache.fragments.bump('photo', photo_id)
     except bigsql.big_ERROR:
         db.session.rollback()
 
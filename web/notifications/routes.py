@@ -0,0 +1,22 @@
+from flask import render_template, Blueprint, request
+from flask_login import current_user, login_required
+
+from . import inbox
+from .notifications import enable_notifications
+
+pages=Blueprint('notifications', __name__, url_prefix='/notifications')
+
+
+@pages.route('/', methods=['GET', 'POST'])
+@login_required
+@enable_notifications
+def index():
+    notifications, next_cursor=inbox.fetch(
+        current_user.username,
+        cursor=request.args.get('after', default=None)
+    )
+    return render_template(
+        'notifications/index.html',
+        notifications=notifications,
+        next_cursor=next_cursor
+    )
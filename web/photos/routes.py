@@ -2,6 +2,7 @@ from flask import Blueprint, render_template, redirect, url_for
 from flask_login import login_required, current_user
 
 from ..app import db
+from ..graph import graph
 
 photos=Blueprint('photos', __name__, url_prefix='/p')
 
@@ -16,12 +17,7 @@ def view(photoID):
     if p is None:
         return redirect(url_for('home.index'))
 
-    follows=db.query('Follow').find(
-        followerUsername=current_user.username,
-        followeeUsername=p.PhotoOwner
-    ).first()
-
-    if follows is None or not follows.acceptedfollow or not p.allFollowers:
+    if not graph.follows(current_user.username, p.photoOwner) or not p.allFollowers:
         return redirect(url_for('home.index'))
 
     shares = list(p.shares)
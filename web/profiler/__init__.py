@@ -0,0 +1,3 @@
+from .profiler import sampler, request_started, request_finished, \
+    install_signal_handler, merge
+from .sampler import Sampler
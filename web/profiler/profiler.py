@@ -0,0 +1,132 @@
+"""
+Opt in sampling profiler for requests.
+
+A request is profiled when any of these hold:
+
+    - its endpoint is listed in PROFILE_ENDPOINTS
+    - it is every PROFILE_EVERY-th request this worker handles
+    - the worker got SIGUSR2 less than PROFILE_SIGNAL_SECONDS ago
+
+While a request is profiled its thread's stack is sampled every
+PROFILE_INTERVAL seconds (see sampler.py), and the samples end up in
+PROFILE_DIR as one collapsed stack file per endpoint and worker.
+`flask merge-profiles` sums them into flame graph input:
+
+    flask merge-profiles --endpoint home.index | flamegraph.pl > index.svg
+
+The signal goes to the workers, not the master, whose USR2 is gunicorn's
+binary upgrade. `kill -USR2 $(pgrep -P <master pid>)` reaches all of them,
+and a second USR2 within the window turns it off again.
+"""
+
+import glob
+import itertools
+import os
+import signal
+import threading
+import time
+
+import click
+from flask import g, request
+
+from .sampler import Sampler
+from ..app import app
+
+sampler=Sampler()
+sampler.configure(
+    app.config['PROFILE_DIR'],
+    interval=app.config['PROFILE_INTERVAL'],
+)
+
+_requests=itertools.count(1)
+_signalled={'until': 0.0}
+
+
+def _endpoint():
+    return request.endpoint or 'unmatched'
+
+
+def wanted(endpoint):
+    if endpoint in app.config['PROFILE_ENDPOINTS']:
+        return True
+    every=app.config['PROFILE_EVERY']
+    if every and next(_requests) % every == 0:
+        return True
+    return time.monotonic() < _signalled['until']
+
+
+def request_started():
+    """
+    before_request hook.
+    """
+    endpoint=_endpoint()
+    if wanted(endpoint):
+        g.profiled=threading.get_ident()
+        sampler.start(g.profiled, endpoint)
+
+
+def request_finished(exc=None):
+    """
+    teardown_request hook, so streamed pages are sampled to the end.
+    """
+    thread_id=g.pop('profiled', None)
+    if thread_id is not None:
+        sampler.stop(thread_id)
+
+
+def _toggle(signum, frame):
+    # no logging here, the handler can interrupt a thread holding
+    # a logging lock
+    if time.monotonic() < _signalled['until']:
+        _signalled['until']=0.0
+    else:
+        _signalled['until']=time.monotonic() + app.config['PROFILE_SIGNAL_SECONDS']
+
+
+def install_signal_handler():
+    """
+    SIGUSR2 turns profiling of every request on for a while. Call from
+    the worker's main thread, gunicorn_config.post_worker_init does.
+    """
+    signal.signal(signal.SIGUSR2, _toggle)
+
+
+def merge(directory, endpoints=()):
+    """
+    Every worker's samples summed, each stack under a root frame naming
+    its endpoint.
+
+    :param endpoints: only these, all when empty
+    :return dict: { stack: samples }
+    """
+    merged={}
+    for path in glob.glob(os.path.join(directory, '*.collapsed')):
+        endpoint=os.path.basename(path).rsplit('.', 2)[0]
+        if endpoints and endpoint not in endpoints:
+            continue
+        with open(path) as f:
+            for line in f:
+                stack, _, count=line.rstrip('\n').rpartition(' ')
+                if not stack:
+                    continue
+                stack='{};{}'.format(endpoint, stack)
+                merged[stack]=merged.get(stack, 0) + int(count)
+    return merged
+
+
+@app.cli.command('merge-profiles')
+@click.option('--endpoint', multiple=True, help='only this endpoint, ie home.index (repeatable)')
+@click.option('--output', type=click.File('w'), default='-', help='file to write, stdout by default')
+@click.option('--clear', is_flag=True, help='remove the per worker files afterwards')
+def merge_command(endpoint, output, clear):
+    """
+    Merges sampled stacks into flame graph input.
+    """
+    directory=app.config['PROFILE_DIR']
+    merged=merge(directory, endpoint)
+    for stack, count in sorted(merged.items()):
+        output.write('{} {}\n'.format(stack, count))
+    click.echo('{} samples'.format(sum(merged.values())), err=True)
+    if clear:
+        for path in glob.glob(os.path.join(directory, '*.collapsed')):
+            os.remove(path)
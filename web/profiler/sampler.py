@@ -0,0 +1,148 @@
+"""
+Statistical stack sampling for chosen threads.
+
+A background thread wakes every `interval` seconds, looks at the current
+frame of each thread that is being profiled (sys._current_frames) and
+counts the stack it is in, collapsed into a single line:
+
+    web/home/routes.py:index;jinja2/environment.py:render;...
+
+Counts are kept per endpoint and written to <directory>/<endpoint>.<pid>.collapsed
+every few seconds, as `stack count` lines, which is what flamegraph.pl and
+speedscope read. Each file has a single writer and is replaced atomically.
+
+Nothing runs while no thread is being profiled, the sampling thread
+waits on a condition until one is. Greenlets are not threads, so under
+gevent workers only the hub's stack would be seen.
+"""
+
+import logging
+import os
+import sys
+import threading
+import time
+
+logger=logging.getLogger(__name__)
+
+# keep the last two path components, web/home/routes.py rather than
+# /usr/src/app/web/home/routes.py
+PATH_PARTS=2
+
+
+def frame_name(code):
+    parts=code.co_filename.replace('\\', '/').split('/')
+    return '{}:{}'.format('/'.join(parts[-PATH_PARTS:]), code.co_name)
+
+
+def collapse(frame):
+    """
+    'outermost;...;innermost' for the stack ending in frame.
+    """
+    names=[]
+    while frame is not None:
+        names.append(frame_name(frame.f_code))
+        frame=frame.f_back
+    return ';'.join(reversed(names)).replace(' ', '_')
+
+
+class Sampler:
+    def __init__(self):
+        self.directory=None
+        self.interval=0.005
+        self.flush_interval=5
+        self.condition=threading.Condition()
+        self._reset()
+
+    def _reset(self):
+        # thread id -> endpoint
+        self.active={}
+        # endpoint -> { stack: samples }
+        self.stacks={}
+        self.dirty=set()
+        self.pid=os.getpid()
+        self.thread=None
+
+    def configure(self, directory, interval=0.005, flush_interval=5):
+        self.directory=directory
+        self.interval=interval
+        self.flush_interval=flush_interval
+
+    def _ensure_process(self):
+        # a forked worker keeps nothing from the master, and threads
+        # do not survive the fork
+        if self.pid != os.getpid():
+            self._reset()
+        if self.thread is None:
+            self.thread=threading.Thread(
+                target=self._sample_forever,
+                name='profile-sampler',
+                daemon=True
+            )
+            self.thread.start()
+
+    def start(self, thread_id, endpoint):
+        with self.condition:
+            self._ensure_process()
+            self.active[thread_id]=endpoint
+            self.condition.notify()
+
+    def stop(self, thread_id):
+        with self.condition:
+            self.active.pop(thread_id, None)
+
+    def sample(self):
+        """
+        Counts one stack for each thread being profiled.
+        """
+        frames=sys._current_frames()
+        with self.condition:
+            for thread_id, endpoint in self.active.items():
+                frame=frames.get(thread_id)
+                if frame is None:
+                    continue
+                stacks=self.stacks.setdefault(endpoint, {})
+                stack=collapse(frame)
+                stacks[stack]=stacks.get(stack, 0) + 1
+                self.dirty.add(endpoint)
+
+    def flush(self):
+        """
+        Writes the endpoints sampled since the last flush to their files.
+        """
+        with self.condition:
+            snapshot={endpoint: dict(self.stacks[endpoint]) for endpoint in self.dirty}
+            self.dirty=set()
+        if self.directory is None:
+            return
+        for endpoint, stacks in snapshot.items():
+            path=os.path.join(self.directory, '{}.{}.collapsed'.format(endpoint, os.getpid()))
+            tmp=path + '.tmp'
+            with open(tmp, 'w') as f:
+                for stack, count in stacks.items():
+                    f.write('{} {}\n'.format(stack, count))
+            os.replace(tmp, path)
+
+    def _sample_forever(self):
+        pid=os.getpid()
+        flushed=time.monotonic()
+        while self.pid == pid:
+            with self.condition:
+                idle=not self.active
+            if idle:
+                self._flush_logged()
+                flushed=time.monotonic()
+                with self.condition:
+                    while not self.active:
+                        self.condition.wait()
+                continue
+            self.sample()
+            if time.monotonic() - flushed > self.flush_interval:
+                self._flush_logged()
+                flushed=time.monotonic()
+            time.sleep(self.interval)
+
+    def _flush_logged(self):
+        try:
+            self.flush()
+        except OSError as e:
+            logger.warning('unable to write profile: {}'.format(e))
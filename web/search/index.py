@@ -0,0 +1,169 @@
+"""
+In memory user search.
+
+Every username, first and last name is loaded once per worker. Usernames
+are kept sorted for prefix lookups with bisect, and every username is
+broken into trigrams so a substring search only has to check the accounts
+sharing all of the terms trigrams, rather than the database scanning every
+row for LIKE '%term%'.
+
+Registration adds the new account in place. Like the follow graph, workers
+notice each others additions through a version stamp in the database (see
+database/stamps.py) and reload when it moves.
+"""
+
+import bisect
+import logging
+import os
+import threading
+
+from flask import g, has_request_context
+
+from ..database import raw, stamps
+
+logger=logging.getLogger(__name__)
+
+STAMP='search-index'
+
+LOAD='SELECT username, fname, lname FROM Person ORDER BY username'
+
+# ranks, best first
+EXACT=0
+USERNAME_PREFIX=1
+NAME_PREFIX=2
+SUBSTRING=3
+
+
+def trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class SearchIndex:
+    def __init__(self):
+        self.usernames=[]
+        self.lowered=[]
+        self.names=[]
+        self.trigrams={}
+        self.version=None
+        self.pid=None
+        self.lock=threading.RLock()
+
+    def _add(self, username, fname=None, lname=None):
+        lowered=username.lower()
+        at=bisect.bisect_left(self.lowered, lowered)
+        if at < len(self.lowered) and self.lowered[at] == lowered:
+            return
+        self.lowered.insert(at, lowered)
+        self.usernames.insert(at, username)
+        for name in (fname, lname):
+            if name:
+                bisect.insort(self.names, (name.lower(), username))
+        for trigram in trigrams(lowered):
+            self.trigrams.setdefault(trigram, set()).add(username)
+
+    def _rows(self):
+        # from the primary, so the rows are at least as new as the stamp
+        return raw.fetch_all(LOAD, primary=True)
+
+    def load(self):
+        """
+        (Re)builds the index from every row in Person.
+        """
+        with self.lock:
+            version=stamps.read(STAMP)
+            rows=self._rows()
+            self.usernames=[]
+            self.lowered=[]
+            self.names=[]
+            self.trigrams={}
+            for row in rows:
+                self._add(row['username'], row['fname'], row['lname'])
+            self.version=version
+            self.pid=os.getpid()
+            logger.debug('loaded search index for {} users'.format(len(self.usernames)))
+
+    def ensure_fresh(self):
+        """
+        Loads the index if this process has not yet, or if another worker
+        changed it since. The stamp is only checked once a request.
+        """
+        if has_request_context():
+            if g.get('search_index_checked', False):
+                return
+            g.search_index_checked=True
+
+        if self._stale():
+            self.load()
+
+    def _stale(self):
+        return self.pid != os.getpid() or self.version != stamps.read(STAMP)
+
+    def added(self, username, fname=None, lname=None):
+        """
+        A newly registered account, after its row is committed. Reloads
+        first if another worker added one since, and only adopts the new
+        stamp if nobody else moved it in between.
+        """
+        with self.lock:
+            if self._stale():
+                self.load()
+            self._add(username, fname, lname)
+            version=stamps.bump(STAMP)
+            if version == self.version + 1:
+                self.version=version
+
+    def _prefixed(self, keys, term, limit):
+        # names are (name, username) pairs, which sort after (term, '')
+        at=bisect.bisect_left(keys, (term, '') if keys is self.names else term)
+        while at < len(keys) and limit > 0:
+            key=keys[at]
+            if isinstance(key, tuple):
+                key=key[0]
+            if not key.startswith(term):
+                return
+            yield at
+            at+=1
+            limit-=1
+
+    def search(self, term, limit):
+        """
+        Usernames matching term, best first: an exact match, then
+        usernames starting with term, then first or last names starting
+        with term, then usernames containing term. Shorter usernames
+        rank first within each group.
+
+        :param str term:
+        :param int limit: max number of usernames to give back
+        :return: [ username ]
+        """
+        self.ensure_fresh()
+        term=term.strip().lower()
+        if not term:
+            return []
+
+        with self.lock:
+            ranks={}
+            for at in self._prefixed(self.lowered, term, limit * 4):
+                ranks[self.usernames[at]]=EXACT if self.lowered[at] == term else USERNAME_PREFIX
+            for at in self._prefixed(self.names, term, limit * 4):
+                ranks.setdefault(self.names[at][1], NAME_PREFIX)
+
+            # shorter terms than a trigram only match as prefixes
+            if len(term) >= 3:
+                candidates=None
+                for trigram in trigrams(term):
+                    posting=self.trigrams.get(trigram, set())
+                    candidates=posting if candidates is None else candidates & posting
+                    if not candidates:
+                        break
+                for username in candidates or ():
+                    if term in username.lower():
+                        ranks.setdefault(username, SUBSTRING)
+
+        return sorted(
+            ranks,
+            key=lambda username: (ranks[username], len(username), username.lower())
+        )[:limit]
+
+
+index=SearchIndex()
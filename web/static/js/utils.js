@@ -117,3 +117,25 @@ $(document).ready(function () {
     })
 });
 
+
+// Pushed notifications and new posts, see web/events
+$(document).ready(function () {
+    let url = document.body.dataset.events;
+    if (!url || !window.EventSource) {
+        return;
+    }
+
+    let source = new EventSource(url);
+
+    source.addEventListener('notification', function () {
+        $('.unread-count').each(function () {
+            $(this).text(parseInt($(this).text() || '0', 10) + 1);
+        });
+    });
+
+    source.addEventListener('post', function () {
+        let count = $('.new-post-count');
+        count.text(parseInt(count.text() || '0', 10) + 1);
+        $('#new-posts').removeClass('d-none');
+    });
+});
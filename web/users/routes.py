@@ -6,9 +6,15 @@ from flask_login import current_user, login_required
 
 from bigsql import bigsql
 from .forms import FollowForm, SearchForm
+from .. import events
+from .. import feed
 from .. import home
 from .. import models
-from ..app import db
+from .. import notifications
+from .. import search
+from ..app import app, db
+from ..database import raw
+from ..graph import graph
 from ..notifications import enable_notifications
 
 users=Blueprint('users', __name__, url_prefix='/u')
@@ -36,6 +42,9 @@ def handle_follow(form):
     )
     try:
         db.session.commit()
+        graph.requested(current_user.username, form.id.data)
+        notifications.inbox.changed(form.id.data, 1)
+        events.notification(form.id.data, 'follow', current_user.username)
     except bigsql.big_ERROR:
         db.session.rollback()
 
@@ -51,6 +60,8 @@ def handle_unfollow(form):
         db.session.delete(f)
         try:
             db.session.commit()
+            graph.removed(current_user.username, form.id.data)
+            feed.timeline.unfollowed(current_user.username, form.id.data)
         except bigsql.big_ERROR:
             db.session.rollback()
     else:
@@ -59,10 +70,45 @@ def handle_unfollow(form):
 
 @validate
 def search_users(form):
-    return db.query('Person').append_raw(
-        'WHERE Person.username LIKE %s',
-        ('%%{}%%'.format(form.content.data),)
+    usernames=search.index.search(
+        form.content.data,
+        limit=app.config['SEARCH_LIMIT']
+    )
+    if len(usernames) == 0:
+        return []
+    persons={
+        p.username: p
+        for p in db.query('Person').append_raw(
+            'WHERE Person.username IN ({})'.format(raw.placeholders(usernames)),
+            tuple(usernames)
+        ).all()
+    }
+    # keep the search ranking
+    return [persons[username] for username in usernames if username in persons]
+
+
+def browse_users(after=None, limit=None):
+    """
+    One page of every account, in username order.
+
+    :param str after: last username of the previous page
+    :param int limit: page size, defaults to USERS_PAGE_SIZE
+    :return: ([ Person ], next cursor or None)
+    """
+    limit=limit or app.config['USERS_PAGE_SIZE']
+    clause=''
+    args=()
+    if after:
+        clause='WHERE Person.username > %s '
+        args=(after,)
+    persons=db.query('Person').append_raw(
+        clause + 'ORDER BY Person.username LIMIT %s',
+        args + (limit + 1,)
     ).all()
+    if len(persons) > limit:
+        persons=persons[:limit]
+        return persons, persons[-1].username
+    return persons, None
 
 
 def handle_users(func):
@@ -94,15 +140,26 @@ def index():
     search_form=SearchForm()
 
     persons=None
+    next_cursor=None
 
     if request.form.get('action', default=None) == 'search':
         persons=search_users(search_form)
 
+    if persons is None:
+        persons, next_cursor=browse_users(
+            after=request.args.get('after', default=None)
+        )
+
     return render_template(
         'users/home.html',
         FollowForm=FollowForm,
         search_form=search_form,
-        persons=persons if persons is not None else models.Person.query.all()
+        persons=persons,
+        next_cursor=next_cursor,
+        follow_states=graph.follows_many(
+            current_user.username,
+            [p.username for p in persons]
+        )
     )
 
 
@@ -119,12 +176,14 @@ def view(username):
     if person is None:
         return redirect('home.index')
 
+    photos=db.sql.SELECTFROM('Photo').WHERE(
+        photoOwner=person.username
+    ).AND(
+        allFollowers=True
+    ).all()
+
     return render_template(
         'users/view.html',
         person=person,
-        photos=db.sql.SELECTFROM('Photo').WHERE(
-            photoOwner=person.username
-        ).AND(
-            allFollowers=True
-        ).all()
+        photos=feed.hydrate(photos)
     )